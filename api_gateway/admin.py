@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Header, HTTPException
+from typing import Optional
+import hmac
+import os
+import logging
+from upstream import UpstreamPool
+from shared_state import shared_state
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin")
+
+# Admin endpoints are disabled unless a token is configured
+GATEWAY_ADMIN_TOKEN = os.getenv("GATEWAY_ADMIN_TOKEN")
+
+
+def _check_token(token: Optional[str]) -> None:
+    if not GATEWAY_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not token or not hmac.compare_digest(token, GATEWAY_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def _set_draining(service: str, url: str, draining: bool) -> dict:
+    instance = UpstreamPool.find(service, url)
+    if instance is None:
+        raise HTTPException(status_code=404, detail=f"Instance {url} of {service} not found")
+    shared_state.set_draining(instance, draining)
+    logger.warning(f"Instance {url} of {service} {'draining' if draining else 'back in rotation'}")
+    return {**instance.stats(), "outstanding": shared_state.outstanding()[service][instance.url]}
+
+
+@router.post("/upstreams/{service}/drain")
+async def drain_instance(service: str, url: str, x_admin_token: Optional[str] = Header(None)):
+    """Stop sending new requests to an instance; in-flight requests finish normally"""
+    _check_token(x_admin_token)
+    return _set_draining(service, url, True)
+
+
+@router.post("/upstreams/{service}/undrain")
+async def undrain_instance(service: str, url: str, x_admin_token: Optional[str] = Header(None)):
+    """Put a drained instance back into rotation"""
+    _check_token(x_admin_token)
+    return _set_draining(service, url, False)
@@ -0,0 +1,97 @@
+import fnmatch
+import logging
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Priority classes from highest to lowest, each with its weight in the bulkhead's concurrency shares
+PRIORITY_ENABLED = os.getenv("PRIORITY_ENABLED", "True").lower() == "true"
+PRIORITY_CLASSES = os.getenv("PRIORITY_CLASSES", "critical:6,normal:3,background:1")
+PRIORITY_DEFAULT_CLASS = os.getenv("PRIORITY_DEFAULT_CLASS", "normal")
+# class:service:method:path[:auth|anon], first match wins; "*" matches anything and paths are globs
+PRIORITY_RULES = os.getenv(
+    "PRIORITY_RULES",
+    "critical:auth:POST:/login,critical:auth:POST:/register,critical:cart:*:*:auth,background:book:GET:*:anon",
+)
+# Status sent to requests shed to make room for higher classes (429 or 503)
+PRIORITY_SHED_STATUS = int(os.getenv("PRIORITY_SHED_STATUS", "503"))
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    name: str
+    rank: int  # 0 is the highest priority
+    weight: float
+
+
+@dataclass(frozen=True)
+class PriorityRule:
+    priority: PriorityClass
+    service: str
+    method: str
+    path: str
+    authenticated: Optional[bool]
+
+    def matches(self, service: str, method: str, path: str, authenticated: bool) -> bool:
+        return (
+            self.service in ("*", service)
+            and self.method in ("*", method)
+            and (self.authenticated is None or self.authenticated == authenticated)
+            and fnmatch.fnmatchcase(path, self.path)
+        )
+
+
+class PriorityClassifier:
+    """Assign each proxied request to a priority class using the configured rules"""
+
+    def __init__(self, classes: str = PRIORITY_CLASSES, rules: str = PRIORITY_RULES, default: str = PRIORITY_DEFAULT_CLASS):
+        self.classes = self._parse_classes(classes)
+        by_name = {c.name: c for c in self.classes}
+        if default not in by_name:
+            logger.error(f"Unknown default priority class {default}, using {self.classes[-1].name}")
+        self.default = by_name.get(default, self.classes[-1])
+        self.rules = self._parse_rules(rules, by_name)
+
+    @staticmethod
+    def _parse_classes(value: str) -> List[PriorityClass]:
+        classes: List[PriorityClass] = []
+        for item in value.split(","):
+            name, _, weight = item.strip().partition(":")
+            if not name:
+                continue
+            try:
+                classes.append(PriorityClass(name, len(classes), max(float(weight or 1), 0.01)))
+            except ValueError:
+                logger.error(f"Ignoring priority class with invalid weight: {item}")
+        return classes or [PriorityClass("default", 0, 1.0)]
+
+    @staticmethod
+    def _parse_rules(value: str, by_name) -> List[PriorityRule]:
+        rules: List[PriorityRule] = []
+        for item in value.split(","):
+            parts = item.strip().split(":")
+            if parts == [""]:
+                continue
+            if len(parts) not in (4, 5) or parts[0] not in by_name or (len(parts) == 5 and parts[4] not in ("auth", "anon")):
+                logger.error(f"Ignoring invalid priority rule: {item}")
+                continue
+            authenticated = None if len(parts) == 4 else parts[4] == "auth"
+            rules.append(PriorityRule(by_name[parts[0]], parts[1], parts[2].upper(), parts[3], authenticated))
+        return rules
+
+    def classify(self, service: str, method: str, path: str, authenticated: bool) -> PriorityClass:
+        """``path`` is the path within the service, e.g. "/login" for /auth/login"""
+        if not PRIORITY_ENABLED:
+            # A single class for everything makes the bulkhead a plain FIFO queue
+            return self.classes[0]
+        for rule in self.rules:
+            if rule.matches(service, method, path, authenticated):
+                return rule.priority
+        return self.default
+
+
+# Create a singleton instance
+priority_classifier = PriorityClassifier()
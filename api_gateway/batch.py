@@ -0,0 +1,281 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlencode
+import asyncio
+import json
+import os
+import re
+import logging
+from routes import proxy_request, HOP_BY_HOP_HEADERS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Batch configuration
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "10"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "10"))
+
+BATCH_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+
+# Headers of the batch request that every sub-request inherits
+INHERITED_HEADERS = ("authorization", "accept-language", "user-agent", "cookie")
+
+# Sub-request headers the gateway computes itself
+_DROPPED_HEADERS = HOP_BY_HOP_HEADERS | {"host", "content-length", "accept-encoding"}
+
+# ${id.body.path.to.value} refers to the result of an earlier sub-request, ${item...} to the for_each element
+_REFERENCE = re.compile(r"\$\{([A-Za-z0-9_\-]+)((?:\.[^.}]+)*)\}")
+
+
+class BatchItem(BaseModel):
+    """One sub-request of a batch"""
+    id: str
+    method: str = "GET"
+    service: str
+    path: str = ""
+    query: Dict[str, str] = Field(default_factory=dict)
+    headers: Dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+    depends_on: List[str] = Field(default_factory=list)
+    for_each: Optional[str] = None
+    timeout: Optional[float] = None
+
+
+class BatchRequest(BaseModel):
+    """Model for POST /batch"""
+    requests: List[BatchItem]
+
+
+class DependencyFailed(Exception):
+    """Raised when a sub-request can't be built from the results it depends on"""
+
+
+def _lookup(value: Any, path: List[str]) -> Any:
+    for key in path:
+        if isinstance(value, list) and key.lstrip("-").isdigit():
+            try:
+                value = value[int(key)]
+            except IndexError:
+                raise DependencyFailed(f"Index {key} out of range")
+        elif isinstance(value, dict) and key in value:
+            value = value[key]
+        else:
+            raise DependencyFailed(f"No field {key}")
+    return value
+
+
+def _resolve(template: Any, scope: Dict[str, Any]) -> Any:
+    """Substitute ${...} references in a string or in every string of a JSON value"""
+    if isinstance(template, dict):
+        return {k: _resolve(v, scope) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_resolve(v, scope) for v in template]
+    if not isinstance(template, str) or "${" not in template:
+        return template
+
+    def value_of(match: "re.Match") -> Any:
+        name, path = match.group(1), match.group(2)
+        if name not in scope:
+            raise DependencyFailed(f"Unknown reference {name}")
+        return _lookup(scope[name], [p for p in path.split(".") if p])
+
+    # A lone reference keeps its JSON type, e.g. a number or a list in a request body
+    whole = _REFERENCE.fullmatch(template)
+    if whole:
+        return value_of(whole)
+    return _REFERENCE.sub(lambda m: str(value_of(m)), template)
+
+
+def _references(item: BatchItem) -> Set[str]:
+    text = json.dumps([item.path, item.query, item.headers, item.body, item.for_each or ""])
+    if item.for_each:
+        text += "${" + item.for_each + "}"
+    return {name for name, _ in _REFERENCE.findall(text)} - {"item"}
+
+
+def _execution_order(items: List[BatchItem]) -> Dict[str, Set[str]]:
+    """Validate a batch and return the dependencies of every sub-request"""
+    ids = [item.id for item in items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Sub-request ids must be unique")
+
+    dependencies: Dict[str, Set[str]] = {}
+    for item in items:
+        if item.method.upper() not in BATCH_METHODS:
+            raise HTTPException(status_code=400, detail=f"Method {item.method} is not allowed in a batch")
+        deps = set(item.depends_on) | _references(item)
+        unknown = deps - set(ids)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"{item.id} depends on unknown sub-requests: {', '.join(sorted(unknown))}")
+        dependencies[item.id] = deps
+
+    # Reject cycles, they would wait on each other forever
+    visiting: Set[str] = set()
+    done: Set[str] = set()
+
+    def visit(node: str) -> None:
+        if node in done:
+            return
+        if node in visiting:
+            raise HTTPException(status_code=400, detail=f"Dependency cycle through {node}")
+        visiting.add(node)
+        for dep in dependencies[node]:
+            visit(dep)
+        visiting.discard(node)
+        done.add(node)
+
+    for node in ids:
+        visit(node)
+    return dependencies
+
+
+def _sub_request(parent: Request, method: str, service: str, path: str, query: Dict[str, Any], headers: Dict[str, str], body: Any) -> Request:
+    """Build an in-process request for the proxy route from a batch sub-request"""
+    content = b""
+    merged = {k: v for k, v in parent.headers.items() if k in INHERITED_HEADERS}
+    merged.update({k.lower(): str(v) for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS})
+    if body is not None:
+        content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        merged.setdefault("content-type", "application/json")
+        merged["content-length"] = str(len(content))
+    merged["accept-encoding"] = "identity"
+
+    url_path = f"/{service}/{path.lstrip('/')}"
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": parent.url.scheme,
+        "path": url_path,
+        "raw_path": url_path.encode(),
+        "root_path": "",
+        "query_string": urlencode({k: str(v) for k, v in query.items()}).encode(),
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in merged.items()],
+        "client": parent.scope.get("client"),
+        "server": parent.scope.get("server"),
+        "app": parent.scope.get("app"),
+    }
+    sent = False
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": content, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    return Request(scope, receive)
+
+
+async def _call(parent: Request, method: str, service: str, path: str, query: Dict[str, Any], headers: Dict[str, str], body: Any) -> Dict[str, Any]:
+    """Run one sub-request through the normal proxy path and decode its response"""
+    request = _sub_request(parent, method, service, path, query, headers, body)
+    try:
+        response = await proxy_request(service, path.lstrip("/"), request)
+    except HTTPException as e:
+        return {"status": e.status_code, "headers": {}, "body": {"detail": e.detail}}
+
+    if isinstance(response, StreamingResponse):
+        try:
+            content = b"".join([chunk async for chunk in response.body_iterator])
+        finally:
+            if response.background is not None:
+                await response.background()
+    else:
+        content = response.body
+
+    response_headers = {
+        k: v for k, v in response.headers.items() if k not in HOP_BY_HOP_HEADERS and k != "content-length"
+    }
+    decoded: Any = None
+    if content:
+        if "json" in response_headers.get("content-type", ""):
+            try:
+                decoded = json.loads(content)
+            except ValueError:
+                decoded = content.decode("utf-8", "replace")
+        else:
+            decoded = content.decode("utf-8", "replace")
+    return {"status": response.status_code, "headers": response_headers, "body": decoded}
+
+
+@router.post("/batch")
+async def batch(batch_request: BatchRequest, request: Request):
+    """Run several sub-requests concurrently and return all of their responses at once.
+
+    Sub-requests go through the same pipeline as proxied requests (auth,
+    cache, coalescing, breakers). A sub-request waits for the ones it
+    depends on, either listed in ``depends_on`` or referenced as
+    ``${id.body.field}``; with ``for_each`` it runs once per element of a
+    list from an earlier result, available as ``${item}``.
+    """
+    items = batch_request.requests
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_REQUESTS} requests")
+    dependencies = _execution_order(items)
+
+    slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    results: Dict[str, asyncio.Future] = {item.id: asyncio.get_running_loop().create_future() for item in items}
+    # for_each expansions count towards the same limit as top-level sub-requests
+    budget = {"remaining": BATCH_MAX_REQUESTS - len(items)}
+
+    async def limited(item: BatchItem, scope: Dict[str, Any]) -> Dict[str, Any]:
+        timeout = min(item.timeout or BATCH_ITEM_TIMEOUT, BATCH_ITEM_TIMEOUT)
+        async with slots:
+            try:
+                return await asyncio.wait_for(
+                    _call(
+                        request,
+                        item.method.upper(),
+                        item.service,
+                        _resolve(item.path, scope),
+                        _resolve(item.query, scope),
+                        _resolve(item.headers, scope),
+                        _resolve(item.body, scope),
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                return {"status": 504, "headers": {}, "body": {"detail": f"Sub-request timed out after {timeout}s"}}
+            except DependencyFailed as e:
+                return {"status": 424, "headers": {}, "body": {"detail": str(e)}}
+
+    async def run(item: BatchItem) -> Dict[str, Any]:
+        scope: Dict[str, Any] = {}
+        for dep in dependencies[item.id]:
+            scope[dep] = await results[dep]
+            if scope[dep]["status"] >= 400:
+                return {"status": 424, "headers": {}, "body": {"detail": f"Dependency {dep} failed"}}
+
+        if not item.for_each:
+            return await limited(item, scope)
+
+        try:
+            elements = _resolve("${" + item.for_each + "}", scope)
+        except DependencyFailed as e:
+            return {"status": 424, "headers": {}, "body": {"detail": str(e)}}
+        if not isinstance(elements, list):
+            return {"status": 424, "headers": {}, "body": {"detail": f"{item.for_each} is not a list"}}
+        if len(elements) > budget["remaining"]:
+            return {"status": 413, "headers": {}, "body": {"detail": "for_each expands beyond BATCH_MAX_REQUESTS"}}
+        budget["remaining"] -= len(elements)
+
+        responses = await asyncio.gather(*(limited(item, {**scope, "item": element}) for element in elements))
+        failed = any(r["status"] >= 400 for r in responses)
+        return {"status": 207 if failed else 200, "headers": {}, "body": list(responses)}
+
+    async def settle(item: BatchItem) -> None:
+        try:
+            result = await run(item)
+        except Exception as e:
+            logger.error(f"Batch sub-request {item.id} failed: {str(e)}")
+            result = {"status": 500, "headers": {}, "body": {"detail": str(e)}}
+        results[item.id].set_result(result)
+
+    await asyncio.gather(*(settle(item) for item in items))
+    return {"responses": [{"id": item.id, **results[item.id].result()} for item in items]}
@@ -0,0 +1,352 @@
+"""Gateway load benchmark.
+
+Starts the gateway (``main:app``) in a subprocess against in-process stub
+auth, book and cart upstreams, drives each scenario at a fixed concurrency
+or a fixed request rate, and reports throughput, latency percentiles and the
+gateway's resident memory. Results can be saved as JSON and compared with a
+previous run:
+
+    python benchmarks/bench.py --duration 10 --concurrency 50 --output before.json
+    python benchmarks/bench.py --duration 10 --concurrency 50 --compare before.json
+
+``--server gunicorn`` runs the gateway the way the Dockerfile does, for
+comparing the production setup with a single uvicorn process.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import start_stubs  # noqa: E402
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    body_size: int = 0
+    description: str = ""
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    s.name: s for s in [
+        Scenario("small_json", "GET", "/auth/payload?size=256", description="Small JSON through the streaming path"),
+        Scenario("large_listing", "GET", "/cart/items?count=2000", description="~200 KB listing, streamed and compressed"),
+        Scenario("cached_listing", "GET", "/book/items?count=2000", description="Listing served from the response cache"),
+        Scenario("upload", "POST", "/cart/upload", body_size=1024 * 1024, description="1 MB request body streamed upstream"),
+        Scenario("slow_upstream", "GET", "/auth/payload?size=256&delay=200", description="Upstream answering after 200 ms"),
+    ]
+}
+
+
+@dataclass
+class Result:
+    scenario: str
+    mode: str
+    duration: float
+    requests: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    rss_start_mb: Optional[float]
+    rss_peak_mb: Optional[float]
+    rss_end_mb: Optional[float]
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def _proc_rss_mb(pid: int) -> Optional[float]:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def _proc_children(pid: int) -> List[int]:
+    children: List[int] = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its children (gunicorn workers) in MB (Linux /proc, or psutil when installed)"""
+    try:
+        total, pending = 0.0, [pid]
+        while pending:
+            current = pending.pop()
+            total += _proc_rss_mb(current) or 0.0
+            pending.extend(_proc_children(current))
+        return total
+    except OSError:
+        pass
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class Load:
+    """Sends one scenario's requests and records latencies"""
+
+    def __init__(self, client: httpx.AsyncClient, scenario: Scenario):
+        self.client = client
+        self.scenario = scenario
+        self.body = b"x" * scenario.body_size if scenario.body_size else None
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    async def send(self, scheduled: Optional[float] = None) -> None:
+        started = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            response = await self.client.request(self.scenario.method, self.scenario.path, content=self.body)
+            if response.status_code >= 400:
+                self.errors += 1
+        except httpx.HTTPError:
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - started)
+
+    async def fixed_concurrency(self, concurrency: int, duration: float) -> None:
+        deadline = time.perf_counter() + duration
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                await self.send()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def fixed_rate(self, rate: float, duration: float, max_outstanding: int) -> None:
+        """Open-loop load; latency is measured from when a request was due, so stalls aren't hidden"""
+        interval = 1 / rate
+        start = time.perf_counter()
+        tasks = set()
+        sent = 0
+        while True:
+            due = start + sent * interval
+            if due - start >= duration:
+                break
+            now = time.perf_counter()
+            if due > now:
+                await asyncio.sleep(due - now)
+            if len(tasks) >= max_outstanding:
+                # The gateway can't keep up; count the request as failed rather than queueing forever
+                self.errors += 1
+            else:
+                task = asyncio.ensure_future(self.send(scheduled=due))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            sent += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def run_scenario(scenario: Scenario, args: argparse.Namespace, gateway_url: str, pid: int) -> Result:
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 100))
+    headers = {"accept-encoding": args.accept_encoding}
+    async with httpx.AsyncClient(base_url=gateway_url, limits=limits, headers=headers, timeout=30) as client:
+        # Warm up connections, caches and the gateway's latency trackers
+        warmup = Load(client, scenario)
+        await warmup.fixed_concurrency(min(args.concurrency, 10), args.warmup)
+
+        load = Load(client, scenario)
+        rss_samples = [rss_mb(pid)]
+
+        async def sample_rss() -> None:
+            while True:
+                await asyncio.sleep(0.5)
+                rss_samples.append(rss_mb(pid))
+
+        sampler = asyncio.ensure_future(sample_rss())
+        started = time.perf_counter()
+        try:
+            if args.rate:
+                await load.fixed_rate(args.rate, args.duration, args.max_outstanding)
+            else:
+                await load.fixed_concurrency(args.concurrency, args.duration)
+        finally:
+            sampler.cancel()
+        elapsed = time.perf_counter() - started
+        rss_samples.append(rss_mb(pid))
+
+    ordered = sorted(load.latencies)
+    known = [s for s in rss_samples if s is not None]
+    return Result(
+        scenario=scenario.name,
+        mode=f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}",
+        duration=round(elapsed, 3),
+        requests=len(ordered),
+        errors=load.errors,
+        rps=round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        p50_ms=round(percentile(ordered, 50) * 1000, 2),
+        p95_ms=round(percentile(ordered, 95) * 1000, 2),
+        p99_ms=round(percentile(ordered, 99) * 1000, 2),
+        max_ms=round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        rss_start_mb=round(known[0], 1) if known else None,
+        rss_peak_mb=round(max(known), 1) if known else None,
+        rss_end_mb=round(known[-1], 1) if known else None,
+    )
+
+
+def start_gateway(args: argparse.Namespace, stub_urls: List[str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "AUTH_SERVICE_URL": stub_urls[0],
+        "BOOK_SERVICE_URL": stub_urls[1],
+        "CART_SERVICE_URL": stub_urls[2],
+        "TRACE_SAMPLE_RATE": "0",
+        # All load comes from one address, which the per-IP rules would answer with 429s
+        "RATE_LIMIT_ENABLED": "False",
+    })
+    for item in args.gateway_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if args.server == "gunicorn":
+        env.update({"HOST": "127.0.0.1", "PORT": str(args.port), "LOG_LEVEL": "warning"})
+        if args.workers:
+            env["WEB_CONCURRENCY"] = str(args.workers)
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--loop", "asyncio", "--http", "h11",
+            "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning", "--no-access-log",
+        ]
+    process = subprocess.Popen(command, cwd=GATEWAY_DIR, env=env)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Gateway exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Gateway did not become healthy")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=GATEWAY_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, dict], baseline_path: str, threshold: float) -> bool:
+    """Print the change against a previous run; True if any scenario regressed beyond ``threshold``"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    regressed = False
+    print(f"\n{'scenario':<16}{'rps':>22}{'p99 ms':>24}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if before["mode"] != current["mode"]:
+            print(f"{name:<16}not compared: baseline ran with {before['mode']}, this run with {current['mode']}")
+            continue
+        rps_change = (current["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+        p99_change = (current["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+        flag = ""
+        if rps_change < -threshold or p99_change > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(
+            f"{name:<16}{before['rps']:>9} -> {current['rps']:<9}({rps_change:+.0%})"
+            f"{before['p99_ms']:>9} -> {current['p99_ms']:<9}({p99_change:+.0%}){flag}"
+        )
+    return regressed
+
+
+async def run(args: argparse.Namespace) -> Dict[str, dict]:
+    stubs = start_stubs(args.stub_port, args.latency / 1000, args.payload_size)
+    gateway = start_gateway(args, [stub.url for stub in stubs])
+    results: Dict[str, dict] = {}
+    try:
+        for name in args.scenarios.split(","):
+            result = await run_scenario(SCENARIOS[name], args, f"http://127.0.0.1:{args.port}", gateway.pid)
+            results[name] = asdict(result)
+            print(
+                f"{name:<16} {result.rps:>9.1f} rps  p50 {result.p50_ms:>8.2f} ms  p95 {result.p95_ms:>8.2f} ms  "
+                f"p99 {result.p99_ms:>8.2f} ms  errors {result.errors:<6} rss {result.rss_peak_mb} MB"
+            )
+    finally:
+        gateway.terminate()
+        gateway.wait(timeout=10)
+        for stub in stubs:
+            stub.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the API gateway against stub upstreams")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds of warm-up per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients (fixed-concurrency mode)")
+    parser.add_argument("--rate", type=float, help="Requests per second (fixed-rate mode instead of fixed concurrency)")
+    parser.add_argument("--max-outstanding", type=int, default=5000, help="In fixed-rate mode, requests in flight before new ones count as errors")
+    parser.add_argument("--latency", type=float, default=0, help="Added stub latency in milliseconds")
+    parser.add_argument("--payload-size", type=int, default=256, help="Default stub payload size in bytes")
+    parser.add_argument("--accept-encoding", default="gzip", help="Accept-Encoding sent by the load generator")
+    parser.add_argument("--port", type=int, default=9300, help="Gateway port")
+    parser.add_argument("--stub-port", type=int, default=9301, help="First of three stub ports")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn",
+                        help="Single uvicorn process on asyncio and h11, or the production gunicorn setup (gunicorn.conf.py)")
+    parser.add_argument("--workers", type=int, help="gunicorn workers (default: one per CPU)")
+    parser.add_argument("--gateway-env", action="append", default=[], metavar="KEY=VALUE", help="Extra gateway environment variable")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare with a previous JSON result and exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative drop in rps or rise in p99")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args))
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
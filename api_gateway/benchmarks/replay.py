@@ -0,0 +1,218 @@
+"""Replay traffic captured by the gateway's capture mode.
+
+Requests are re-issued against ``--target`` at their original offsets
+divided by ``--speed``, so bursts and overlaps (the concurrency shape) are
+kept while the rate is scaled. Latency is reported per route template and
+can be compared with the report of another build:
+
+    python benchmarks/replay.py /tmp/gateway-capture/*.jsonl --target http://localhost:8000 \\
+        --speed 5 --auth-token "$TOKEN" --output new.json --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GATEWAY_DIR)
+from capture import REDACTED, decode_body, read_capture  # noqa: E402
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(latencies: List[float], captured: List[float]) -> Dict[str, float]:
+    ordered, original = sorted(latencies), sorted(captured)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "captured_p50_ms": round(percentile(original, 50) * 1000, 2),
+        "captured_p99_ms": round(percentile(original, 99) * 1000, 2),
+    }
+
+
+class Replay:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.latencies: Dict[str, List[float]] = {}
+        self.captured: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.status_mismatches = 0
+        self.rate_limited = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.max_outstanding_seen = 0
+
+    def _headers(self, record: dict) -> Dict[str, str]:
+        headers = dict(record.get("h", {}))
+        if headers.get("authorization") == REDACTED:
+            del headers["authorization"]
+            if self.args.auth_token:
+                headers["authorization"] = f"Bearer {self.args.auth_token}"
+        if headers.get("cookie") == REDACTED:
+            del headers["cookie"]
+        return headers
+
+    async def send(self, record: dict, due: float) -> None:
+        route = record.get("r", record["p"])
+        try:
+            response = await self.client.request(
+                record["m"],
+                record["p"] + (f"?{record['q']}" if record.get("q") else ""),
+                headers=self._headers(record),
+                content=decode_body(record),
+            )
+            await response.aread()
+            if response.status_code == 429 and record["s"] != 429:
+                # Answered by the target's rate limiter, not by the route being measured
+                self.rate_limited += 1
+                return
+            if response.status_code != record["s"]:
+                self.status_mismatches += 1
+        except httpx.HTTPError:
+            self.errors += 1
+            return
+        self.latencies.setdefault(route, []).append(time.perf_counter() - due)
+        self.captured.setdefault(route, []).append(record["d"])
+
+    async def run(self, records: List[dict]) -> float:
+        tasks = set()
+        origin = records[0]["t"]
+        start = time.perf_counter()
+        for record in records:
+            if record["rb"] and "b" not in record:
+                # The body wasn't sampled, and replaying a write without it would only measure 4xx handling
+                self.skipped += 1
+                continue
+            due = start + (record["t"] - origin) / self.args.speed
+            now = time.perf_counter()
+            if due > now:
+                await asyncio.sleep(due - now)
+            if len(tasks) >= self.args.max_outstanding:
+                self.dropped += 1
+                continue
+            task = asyncio.ensure_future(self.send(record, due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            self.max_outstanding_seen = max(self.max_outstanding_seen, len(tasks))
+        if tasks:
+            await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float, captured_span: float) -> dict:
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        all_captured = [value for values in self.captured.values() for value in values]
+        return {
+            "meta": {
+                "target": self.args.target,
+                "speed": self.args.speed,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "captured_seconds": round(captured_span, 3),
+                "replay_seconds": round(elapsed, 3),
+            },
+            "summary": {
+                **summarize(all_latencies, all_captured),
+                "rps": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+                "errors": self.errors,
+                "status_mismatches": self.status_mismatches,
+                "rate_limited": self.rate_limited,
+                "skipped": self.skipped,
+                "dropped": self.dropped,
+                "max_outstanding": self.max_outstanding_seen,
+            },
+            "routes": {
+                route: summarize(latencies, self.captured[route])
+                for route, latencies in sorted(self.latencies.items())
+            },
+        }
+
+
+def compare(report: dict, baseline_path: str, threshold: float) -> bool:
+    """Print p50/p99 changes per route; True if any p99 rose by more than ``threshold``"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressed = False
+    rows = [("all", report["summary"], baseline["summary"])]
+    rows += [(route, stats, baseline["routes"][route]) for route, stats in report["routes"].items() if route in baseline["routes"]]
+    print(f"\n{'route':<32}{'p50 ms':>26}{'p99 ms':>26}")
+    for route, current, before in rows:
+        p99_change = (current["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+        p50_change = (current["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        flag = ""
+        if p99_change > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(
+            f"{route:<32}{before['p50_ms']:>9} -> {current['p50_ms']:<9}({p50_change:+.0%})"
+            f"{before['p99_ms']:>9} -> {current['p99_ms']:<9}({p99_change:+.0%}){flag}"
+        )
+    return regressed
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    records = read_capture(args.capture)
+    if args.methods:
+        methods = {m.strip().upper() for m in args.methods.split(",")}
+        records = [r for r in records if r["m"] in methods]
+    if args.seconds and records:
+        records = [r for r in records if r["t"] - records[0]["t"] <= args.seconds]
+    if not records:
+        raise SystemExit("No captured requests to replay")
+    captured_span = records[-1]["t"] - records[0]["t"]
+    print(f"Replaying {len(records)} requests captured over {captured_span:.1f}s at {args.speed}x against {args.target}")
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=args.timeout) as client:
+        replay = Replay(client, args)
+        elapsed = await replay.run(records)
+    return replay.report(elapsed, captured_span)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured gateway traffic")
+    parser.add_argument("capture", nargs="+", help="Capture files written by the gateway (capture-<pid>.jsonl)")
+    parser.add_argument("--target", required=True, help="Base URL of the gateway to replay against")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time compression factor, e.g. 1, 5 or 10")
+    parser.add_argument("--auth-token", help="Bearer token sent in place of redacted Authorization headers")
+    parser.add_argument("--methods", help="Only replay these methods, e.g. GET,HEAD")
+    parser.add_argument("--seconds", type=float, help="Only replay the first N seconds of the capture")
+    parser.add_argument("--max-outstanding", type=int, default=5000, help="Requests in flight before new ones are dropped")
+    parser.add_argument("--max-connections", type=int, default=500, help="Connection pool size of the replay client")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Report of an earlier replay to compare with; exits with 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative rise in p99 per route")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    summary = report["summary"]
+    print(
+        f"{summary['count']} requests, {summary['rps']} rps, p50 {summary['p50_ms']} ms, "
+        f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms (captured p50 {summary['captured_p50_ms']} ms, "
+        f"p99 {summary['captured_p99_ms']} ms); {summary['errors']} errors, "
+        f"{summary['status_mismatches']} status mismatches, {summary['rate_limited']} rate limited, "
+        f"{summary['skipped']} skipped, {summary['dropped']} dropped"
+    )
+    if summary["rate_limited"]:
+        print("The target answered with 429; run it with RATE_LIMIT_ENABLED=False for replays", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare and compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Stub upstreams for gateway benchmarks.
+
+Each stub answers every path of one service with a configurable delay and
+payload size, so a benchmark measures the gateway rather than MongoDB or
+the real services. Query parameters override the defaults per request:
+
+    GET  /payload?size=256&delay=50    JSON body of about ``size`` bytes
+    GET  /items?count=1000             JSON listing of ``count`` books
+    POST /upload                       reads the whole body and returns its length
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import List
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+def create_stub(name: str, latency: float = 0.0, payload_size: int = 256) -> Starlette:
+    """Stub service; ``latency`` is in seconds and applies to every request"""
+
+    async def delay(request: Request) -> None:
+        seconds = float(request.query_params.get("delay", latency * 1000)) / 1000
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    async def health(request: Request) -> Response:
+        return JSONResponse({"status": "healthy", "service": name})
+
+    async def payload(request: Request) -> Response:
+        await delay(request)
+        size = int(request.query_params.get("size", payload_size))
+        body = json.dumps({"service": name, "data": "x" * max(0, size - 30)})
+        return Response(body, media_type="application/json")
+
+    async def items(request: Request) -> Response:
+        await delay(request)
+        count = int(request.query_params.get("count", 1000))
+        listing = [
+            {"id": f"{i:024x}", "title": f"Book {i}", "author": "Author", "price": 9.99, "tags": ["fiction", "classic"]}
+            for i in range(count)
+        ]
+        return JSONResponse(listing)
+
+    async def upload(request: Request) -> Response:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+        await delay(request)
+        return JSONResponse({"service": name, "received": received})
+
+    return Starlette(routes=[
+        Route("/health", health),
+        Route("/items", items),
+        Route("/upload", upload, methods=["POST", "PUT"]),
+        Route("/{path:path}", payload, methods=["GET", "POST", "PUT", "PATCH", "DELETE"]),
+    ])
+
+
+class StubServer:
+    """Run a stub on its own event loop in a background thread"""
+
+    def __init__(self, name: str, port: int, latency: float = 0.0, payload_size: int = 256):
+        config = uvicorn.Config(
+            create_stub(name, latency, payload_size),
+            host="127.0.0.1",
+            port=port,
+            log_level="warning",
+            access_log=False,
+        )
+        self.server = uvicorn.Server(config)
+        self.url = f"http://127.0.0.1:{port}"
+        self._thread = threading.Thread(target=self.server.run, name=f"stub-{name}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Stub at {self.url} did not start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def start_stubs(base_port: int, latency: float = 0.0, payload_size: int = 256) -> List[StubServer]:
+    """Start auth, book and cart stubs on consecutive ports"""
+    stubs = [
+        StubServer(name, base_port + offset, latency, payload_size)
+        for offset, name in enumerate(("auth", "book", "cart"))
+    ]
+    for stub in stubs:
+        stub.start()
+    return stubs
@@ -0,0 +1,216 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Response cache configuration
+CACHE_SERVICES = {s.strip() for s in os.getenv("CACHE_SERVICES", "book").split(",") if s.strip()}
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+CACHEABLE_METHODS = {"GET"}
+INVALIDATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+CACHEABLE_STATUS_CODES = {200}
+# Headers describing one particular upstream exchange, not the cached representation
+PER_RESPONSE_HEADERS = {"server-timing"}
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a directive -> argument mapping"""
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') if arg else None
+    return directives
+
+
+@dataclass
+class CacheEntry:
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    expires_at: float
+    stored_at: float = field(default_factory=time.monotonic)
+    # Precompressed copies of the body, by content-encoding
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.body)
+            + sum(len(k) + len(v) for k, v in self.headers.items())
+            + sum(len(v) for v in self.variants.values())
+        )
+
+    def response_headers(self) -> Dict[str, str]:
+        headers = dict(self.headers)
+        headers["age"] = str(int(time.monotonic() - self.stored_at))
+        headers["x-cache"] = "HIT"
+        return headers
+
+
+class ResponseCache:
+    """In-process LRU/TTL cache for upstream GET responses.
+
+    Entries are keyed on service, path, normalized query parameters and the
+    Accept-Encoding sent upstream (bodies are stored exactly as the upstream
+    sent them). Compressed variants produced by the gateway are kept on the
+    entry. Every write that passes through the gateway to a cached service
+    drops all of that service's entries.
+    """
+
+    def __init__(
+        self,
+        services=CACHE_SERVICES,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        max_entry_bytes: int = CACHE_MAX_ENTRY_BYTES,
+    ):
+        self.services = set(services)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key_for(self, service: str, path: str, request: Request, upstream_encoding: str) -> Optional[Tuple]:
+        """Return the cache key for a request, or None if it must bypass the cache"""
+        if service not in self.services or request.method not in CACHEABLE_METHODS:
+            return None
+        request_cc = parse_cache_control(request.headers.get("cache-control", ""))
+        if "no-store" in request_cc:
+            return None
+        # Shared caches must not serve per-user responses
+        if "authorization" in request.headers:
+            return None
+        query = tuple(sorted(request.query_params.multi_items()))
+        # Bodies are stored as the upstream encoded them, so that is part of the key
+        encoding = upstream_encoding.replace(" ", "").lower()
+        return (service, path, query, encoding)
+
+    def get(self, key: Tuple, request: Request) -> Optional[CacheEntry]:
+        if "no-cache" in parse_cache_control(request.headers.get("cache-control", "")):
+            self.misses += 1
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key: Tuple, status_code: int, headers: Dict[str, str], body: bytes) -> bool:
+        """Store an upstream response if its status and Cache-Control allow it"""
+        if status_code not in CACHEABLE_STATUS_CODES or "set-cookie" in headers:
+            return False
+        ttl = self._ttl_for(headers)
+        if ttl <= 0:
+            return False
+        entry = CacheEntry(
+            status_code=status_code,
+            headers={k: v for k, v in headers.items() if k not in PER_RESPONSE_HEADERS},
+            body=body,
+            expires_at=time.monotonic() + ttl,
+        )
+        if entry.size > self.max_entry_bytes:
+            return False
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.current_bytes += entry.size
+        self._evict()
+        return True
+
+    def variant(self, key: Tuple, encoding: str) -> Optional[bytes]:
+        """Return a precompressed copy of a cached body, if one was stored"""
+        entry = self._entries.get(key)
+        return entry.variants.get(encoding) if entry is not None else None
+
+    def add_variant(self, key: Tuple, encoding: str, body: bytes) -> None:
+        """Keep a compressed copy next to a cached body so it is compressed only once"""
+        entry = self._entries.get(key)
+        if entry is None or encoding in entry.variants:
+            return
+        if entry.size + len(body) > self.max_entry_bytes:
+            return
+        entry.variants[encoding] = body
+        self.current_bytes += len(body)
+        self._evict()
+
+    def invalidate(self, service: str) -> None:
+        """Drop every entry cached for a service"""
+        keys = [key for key in self._entries if key[0] == service]
+        for key in keys:
+            self._remove(key)
+        if keys:
+            self.invalidations += 1
+            logger.info(f"Invalidated {len(keys)} cached {service} responses")
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _ttl_for(self, headers: Dict[str, str]) -> float:
+        directives = parse_cache_control(headers.get("cache-control", ""))
+        if {"no-store", "no-cache", "private"} & directives.keys():
+            return 0
+        for name in ("s-maxage", "max-age"):
+            value = directives.get(name)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError:
+                    return 0
+        return self.ttl
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.current_bytes -= entry.size
+            self.evictions += 1
+
+
+# Create a singleton instance
+response_cache = ResponseCache()
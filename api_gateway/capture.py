@@ -0,0 +1,205 @@
+import base64
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from urllib.parse import unquote_plus
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from route_templates import route_template
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Capture configuration (off unless explicitly enabled)
+CAPTURE_ENABLED = os.getenv("CAPTURE_ENABLED", "False").lower() == "true"
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "/tmp/gateway-capture")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_BODY_SAMPLE_RATE = float(os.getenv("CAPTURE_BODY_SAMPLE_RATE", "0"))
+CAPTURE_MAX_BODY_BYTES = int(os.getenv("CAPTURE_MAX_BODY_BYTES", str(64 * 1024)))
+# Bodies of these services are never recorded (auth bodies contain passwords)
+CAPTURE_BODY_EXCLUDE_SERVICES = {
+    s.strip() for s in os.getenv("CAPTURE_BODY_EXCLUDE_SERVICES", "auth").split(",") if s.strip()
+}
+
+# Request headers worth replaying; credentials are recorded only as "<redacted>"
+CAPTURE_HEADERS = {"accept", "accept-encoding", "content-type", "if-none-match", "cache-control"}
+REDACTED_HEADERS = {"authorization", "cookie"}
+REDACTED = "<redacted>"
+# Query parameters whose name contains one of these words are recorded as "<redacted>"
+# (e.g. the token of /auth/verify-email links)
+CAPTURE_REDACTED_PARAMS = [
+    s.strip().lower() for s in os.getenv(
+        "CAPTURE_REDACTED_PARAMS", "token,password,secret,code,key,signature,session"
+    ).split(",") if s.strip()
+]
+
+
+class CaptureLog:
+    """Buffered JSON-lines writer, one file per worker process"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file = None
+
+    def write(self, record: Dict[str, object]) -> None:
+        try:
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"capture-{os.getpid()}.jsonl")
+                self._file = open(path, "a")
+                logger.warning(f"Capturing gateway traffic to {path}")
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.error(f"Could not write capture record: {str(e)}")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+capture_log = CaptureLog(CAPTURE_DIR)
+
+
+def _captured_headers(raw_headers: Iterable) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    for key, value in raw_headers:
+        name = key.decode("latin-1").lower()
+        if name in REDACTED_HEADERS:
+            headers[name] = REDACTED
+        elif name in CAPTURE_HEADERS:
+            headers[name] = value.decode("latin-1")
+    return headers
+
+
+def _sensitive_param(name: str) -> bool:
+    name = name.lower()
+    return any(word in name for word in CAPTURE_REDACTED_PARAMS)
+
+
+def _captured_query(query: str) -> str:
+    parts = []
+    for part in query.split("&"):
+        name, sep, _ = part.partition("=")
+        parts.append(f"{name}={REDACTED}" if sep and _sensitive_param(unquote_plus(name)) else part)
+    return "&".join(parts)
+
+
+def _captured_batch_body(body: bytes) -> Optional[bytes]:
+    """The /batch body with each sub-request redacted like a request of its own: credentials
+    and sensitive query parameters masked, and bodies of excluded services dropped"""
+    try:
+        batch = json.loads(body)
+        items = batch["requests"]
+        for item in items:
+            if item.get("service") in CAPTURE_BODY_EXCLUDE_SERVICES and item.get("body") is not None:
+                item["body"] = REDACTED
+            headers: Dict[str, Any] = item.get("headers") or {}
+            for name in headers:
+                if name.lower() in REDACTED_HEADERS:
+                    headers[name] = REDACTED
+            query: Dict[str, Any] = item.get("query") or {}
+            for name in query:
+                if _sensitive_param(name):
+                    query[name] = REDACTED
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # Not a batch the gateway would accept; not worth keeping
+        return None
+    return json.dumps(batch, separators=(",", ":")).encode()
+
+
+class CaptureMiddleware:
+    """Pure ASGI middleware recording proxied requests for later replay.
+
+    Each record holds the start time, method, path, query, selected headers
+    (credentials and sensitive query parameters redacted), status, duration
+    and sizes, plus the request body for a CAPTURE_BODY_SAMPLE_RATE share of
+    requests; /batch bodies are redacted per sub-request. Only requests to
+    the proxied services and /batch are recorded.
+    """
+
+    def __init__(self, app: ASGIApp, services: Iterable[str]):
+        self.app = app
+        self.prefixes: Set[str] = set(services) | {"batch"}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        service = scope["path"].split("/", 2)[1] if scope["path"].startswith("/") else ""
+        if service not in self.prefixes or random.random() >= CAPTURE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        keep_body = service not in CAPTURE_BODY_EXCLUDE_SERVICES and random.random() < CAPTURE_BODY_SAMPLE_RATE
+        body: List[bytes] = []
+        received = sent = 0
+        truncated = False
+        status_code = 500
+
+        async def capturing_receive() -> Message:
+            nonlocal received, truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if keep_body and not truncated:
+                    if received > CAPTURE_MAX_BODY_BYTES:
+                        truncated = True
+                        body.clear()
+                    else:
+                        body.append(chunk)
+            return message
+
+        async def capturing_send(message: Message) -> None:
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, capturing_receive, capturing_send)
+        finally:
+            record: Dict[str, object] = {
+                "t": round(started_at, 6),
+                "d": round(time.perf_counter() - started, 6),
+                "m": scope["method"],
+                "p": scope["path"],
+                "r": route_template(service, scope["path"][len(service) + 2:]),
+                "s": status_code,
+                "rb": received,
+                "sb": sent,
+            }
+            if scope.get("query_string"):
+                record["q"] = _captured_query(scope["query_string"].decode("latin-1"))
+            headers = _captured_headers(scope["headers"])
+            if headers:
+                record["h"] = headers
+            if keep_body and body and not truncated:
+                content: Optional[bytes] = b"".join(body)
+                if service == "batch":
+                    content = _captured_batch_body(content)
+                if content:
+                    record["b"] = base64.b64encode(content).decode("ascii")
+            capture_log.write(record)
+
+
+def read_capture(paths: Iterable[str]) -> List[Dict[str, object]]:
+    """Load capture records from one or more files, ordered by start time"""
+    records: List[Dict[str, object]] = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def decode_body(record: Dict[str, object]) -> Optional[bytes]:
+    body = record.get("b")
+    return base64.b64decode(body) if body else None
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Request coalescing configuration
+COALESCE_SERVICES = {s.strip() for s in os.getenv("COALESCE_SERVICES", "book").split(",") if s.strip()}
+COALESCE_KEY_HEADERS = [
+    h.strip().lower()
+    for h in os.getenv("COALESCE_KEY_HEADERS", "accept,accept-encoding,authorization").split(",")
+    if h.strip()
+]
+
+COALESCABLE_METHODS = {"GET", "HEAD"}
+
+# Status, headers and body: the raw bytes, or an open stream (with ``aclose``) when too large to buffer
+UpstreamResult = Tuple[int, Dict[str, str], Any]
+
+
+def _close_unclaimed(task: "asyncio.Task[UpstreamResult]") -> None:
+    """Close the stream of a call whose leader went away before it could relay it"""
+    if task.cancelled() or task.exception() is not None:
+        return
+    content = task.result()[2]
+    if not isinstance(content, bytes):
+        asyncio.ensure_future(content.aclose())
+
+
+class SingleFlight:
+    """Merge concurrent identical idempotent requests into one upstream call.
+
+    The first request for a key runs the upstream call in its own task; any
+    identical request arriving before it completes waits on that task and
+    receives a copy of the same result. The task is shielded, so a leader
+    whose client disconnects does not cancel the call for everyone else.
+    A response too large to buffer can only be relayed once, so it goes to
+    the leader and every waiter makes its own call.
+    """
+
+    def __init__(self, services=COALESCE_SERVICES, key_headers=COALESCE_KEY_HEADERS):
+        self.services = set(services)
+        self.key_headers = list(key_headers)
+        self._inflight: Dict[Tuple, "asyncio.Task[UpstreamResult]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def key_for(self, service: str, path: str, request: Request) -> Optional[Tuple]:
+        """Return the coalescing key for a request, or None if it must not be merged"""
+        if service not in self.services or request.method not in COALESCABLE_METHODS:
+            return None
+        query = tuple(sorted(request.query_params.multi_items()))
+        headers = tuple(request.headers.get(name, "") for name in self.key_headers)
+        return (request.method, service, path, query, headers)
+
+    async def run(self, key: Tuple, call: Callable[[], Awaitable[UpstreamResult]]) -> UpstreamResult:
+        task = self._inflight.get(key)
+        leader = task is None
+        if leader:
+            self.leaders += 1
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced request for {key[1]}/{key[2]}")
+
+        try:
+            status_code, headers, content = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if leader:
+                task.add_done_callback(_close_unclaimed)
+            raise
+        if not isinstance(content, bytes):
+            if leader:
+                return status_code, headers, content
+            return await call()
+        # Every waiter gets its own headers so later mutations don't leak across responses
+        return status_code, dict(headers), content
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# Create a singleton instance
+single_flight = SingleFlight()
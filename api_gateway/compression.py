@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import zlib
+from typing import AsyncIterator, Dict, List, MutableMapping, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# brotli and zstandard are optional; encodings whose library is missing are never offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression configuration
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+COMPRESSION_ENCODINGS = [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(",") if e.strip()]
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_THREAD_THRESHOLD = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", str(256 * 1024)))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def _available(encoding: str) -> bool:
+    if encoding == "gzip":
+        return True
+    if encoding == "br":
+        return brotli is not None
+    if encoding == "zstd":
+        return zstandard is not None
+    return False
+
+
+SUPPORTED_ENCODINGS: List[str] = [e for e in COMPRESSION_ENCODINGS if _available(e)]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding the client accepts, honouring q-values"""
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(status_code: int, headers: MutableMapping[str, str], size: Optional[int]) -> bool:
+    """True if a response may be compressed by the gateway"""
+    if status_code < 200 or status_code in (204, 206, 304):
+        return False
+    if "content-encoding" in headers:
+        return False
+    if not headers.get("content-type", "").lower().startswith(COMPRESSIBLE_TYPES):
+        return False
+    return size is None or size >= COMPRESSION_MIN_SIZE
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+async def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body, off the event loop when it is large"""
+    if len(data) >= COMPRESSION_THREAD_THRESHOLD:
+        return await asyncio.get_running_loop().run_in_executor(None, _compress, data, encoding)
+    return _compress(data, encoding)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Strong ETags must differ between representations, so tag the encoding onto it"""
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def encoded_headers(headers: Dict[str, str], encoding: str, length: Optional[int]) -> Dict[str, str]:
+    """Headers for the compressed representation of a response"""
+    headers = dict(headers)
+    headers["content-encoding"] = encoding
+    headers.pop("content-length", None)
+    if length is not None:
+        headers["content-length"] = str(length)
+    add_vary(headers)
+    if "etag" in headers:
+        headers["etag"] = encoded_etag(headers["etag"], encoding)
+    return headers
+
+
+def add_vary(headers: MutableMapping[str, str]) -> None:
+    """Mark a compressible response that went out uncompressed as varying on Accept-Encoding"""
+    vary = headers.get("vary")
+    if not vary:
+        headers["vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding"
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._flush = self._compressor.finish
+            self._compress = self._compressor.process
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush = self._compressor.flush
+            self._compress = self._compressor.compress
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._flush = self._compressor.flush
+            self._compress = self._compressor.compress
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._flush()
+
+
+async def compress_stream(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """Compress a streamed body chunk by chunk"""
+    compressor = _StreamCompressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    tail = compressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,72 @@
+import hashlib
+import os
+from typing import Dict, MutableMapping, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Services whose GET responses get a gateway-computed ETag
+ETAG_SERVICES = {s.strip() for s in os.getenv("ETAG_SERVICES", "book").split(",") if s.strip()}
+
+# Default Cache-Control sent to clients per service, overridable with CACHE_CONTROL_<SERVICE>.
+# Book responses must be revalidated, which is cheap thanks to the ETag.
+DEFAULT_CACHE_CONTROL = {
+    "book": "public, max-age=0, must-revalidate",
+}
+
+# Validators of a conditional GET. The gateway answers them itself from the full response, so they
+# are not sent upstream on buffered reads: a shared (coalesced or cached) upstream call must return
+# the body, not a 304 meant for one client
+CONDITIONAL_REQUEST_HEADERS = {"if-none-match", "if-modified-since"}
+CONDITIONAL_METHODS = {"GET", "HEAD"}
+
+# Headers a 304 response keeps from the full response
+NOT_MODIFIED_HEADERS = {"cache-control", "content-location", "date", "etag", "expires", "vary", "age", "x-cache"}
+
+
+def cache_control_for(service: str) -> Optional[str]:
+    """Return the configured client Cache-Control policy for a service"""
+    return os.getenv(f"CACHE_CONTROL_{service.upper()}", DEFAULT_CACHE_CONTROL.get(service)) or None
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag derived from the exact bytes sent to the client"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_enabled(service: str, method: str, status_code: int) -> bool:
+    return service in ETAG_SERVICES and method == "GET" and status_code == 200
+
+
+def apply_cache_policy(service: str, method: str, status_code: int, headers: MutableMapping[str, str]) -> None:
+    """Add the service's Cache-Control policy unless the upstream set one"""
+    if method != "GET" or status_code != 200 or "cache-control" in headers:
+        return
+    policy = cache_control_for(service)
+    if policy:
+        headers["cache-control"] = policy
+
+
+def if_none_match(request: Request, etag: Optional[str]) -> bool:
+    """True if the request's If-None-Match matches the ETag (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    current = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """Build a 304 response carrying only the validator and caching headers"""
+    return Response(
+        status_code=304,
+        headers={k: v for k, v in headers.items() if k.lower() in NOT_MODIFIED_HEADERS},
+    )
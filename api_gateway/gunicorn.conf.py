@@ -0,0 +1,75 @@
+"""Production server settings: ``gunicorn -c gunicorn.conf.py main:app``
+
+Gunicorn supervises one uvicorn worker (uvloop and httptools) per CPU. The
+app is imported once in the master and forked, and each worker opens its
+own upstream pools in the startup event. On SIGTERM workers stop
+accepting, finish in-flight requests (up to GRACEFUL_TIMEOUT) and close
+their pools.
+"""
+import glob
+import math
+import os
+
+
+def cpu_count() -> int:
+    """CPUs available to this process, honouring a cgroup v2 CPU quota (containers)"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(cpu_count())))
+worker_class = "worker.GatewayWorker"
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))
+backlog = int(os.getenv("LISTEN_BACKLOG", "2048"))
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = "-" if os.getenv("ACCESS_LOG", "False").lower() == "true" else None
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# prometheus_client reads this when it is first imported, which happens when
+# the app is preloaded below, so it has to be set here. Each worker writes its
+# samples to files in the directory and /metrics aggregates them.
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/gateway-prometheus")
+    # Drained instances and cache invalidations are shared by the workers through this directory
+    os.environ.setdefault("GATEWAY_STATE_DIR", "/tmp/gateway-state")
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Samples of a previous run would be added to this one's
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+    directory = os.environ.get("GATEWAY_STATE_DIR")
+    if directory:
+        # Drains don't outlive a restart, as with a single process
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    if os.environ.get("GATEWAY_STATE_DIR"):
+        # A worker that crashed can't remove its outstanding counts itself
+        try:
+            os.remove(os.path.join(os.environ["GATEWAY_STATE_DIR"], f"worker-{worker.pid}.json"))
+        except OSError:
+            pass
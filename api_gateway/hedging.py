@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Hedging configuration
+HEDGE_SERVICES = {s.strip() for s in os.getenv("HEDGE_SERVICES", "book").split(",") if s.strip()}
+HEDGE_DELAY = os.getenv("HEDGE_DELAY", "p95")  # seconds, or a percentile of observed latency such as p95
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_LATENCY_SAMPLES = int(os.getenv("HEDGE_LATENCY_SAMPLES", "500"))
+
+# Retry configuration
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "2"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.05"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SEC = float(os.getenv("RETRY_BUDGET_MIN_PER_SEC", "1"))
+RETRY_BUDGET_MAX = float(os.getenv("RETRY_BUDGET_MAX", "10"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+# Errors raised before the request reached the upstream, so it is always safe to retry them
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Recent upstream latencies of one service, used to derive the hedge delay"""
+
+    def __init__(self, samples: int = HEDGE_LATENCY_SAMPLES):
+        self._samples: Deque[float] = deque(maxlen=samples)
+        self._recorded = 0
+        self._cached: Dict[float, float] = {}
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._recorded += 1
+        # Percentiles are recomputed every few samples rather than on every request
+        if self._recorded % 20 == 0:
+            self._cached.clear()
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < 20:
+            return None
+        if p not in self._cached:
+            ordered = sorted(self._samples)
+            self._cached[p] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+        return self._cached[p]
+
+
+class RetryBudget:
+    """Token bucket limiting retries and hedges to a share of the route's traffic.
+
+    Every request deposits RETRY_BUDGET_RATIO tokens and the bucket also
+    refills at RETRY_BUDGET_MIN_PER_SEC, so retries can never amplify load by
+    more than roughly that ratio during an overload.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_sec: float = RETRY_BUDGET_MIN_PER_SEC, maximum: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.maximum = maximum
+        self.tokens = maximum
+        self.updated = time.monotonic()
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.maximum, self.tokens + self.ratio + (now - self.updated) * self.min_per_sec)
+        self.updated = now
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
+
+
+_latencies: Dict[str, LatencyTracker] = {}
+_budgets: Dict[str, RetryBudget] = {}
+
+
+def latency_tracker(service: str) -> LatencyTracker:
+    tracker = _latencies.get(service)
+    if tracker is None:
+        tracker = _latencies[service] = LatencyTracker()
+    return tracker
+
+
+def retry_budget(route: str) -> RetryBudget:
+    budget = _budgets.get(route)
+    if budget is None:
+        budget = _budgets[route] = RetryBudget()
+    return budget
+
+
+def hedge_delay(service: str) -> Optional[float]:
+    """Seconds to wait before hedging a request to this service, None if it shouldn't be hedged"""
+    if service not in HEDGE_SERVICES:
+        return None
+    if HEDGE_DELAY.startswith("p"):
+        observed = latency_tracker(service).percentile(float(HEDGE_DELAY[1:]))
+        if observed is None:
+            return None
+        return max(HEDGE_MIN_DELAY, observed)
+    return max(HEDGE_MIN_DELAY, float(HEDGE_DELAY))
+
+
+def retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+
+async def hedged(attempt: Callable[[], Awaitable[T]], delay: Optional[float], budget: RetryBudget) -> T:
+    """Run ``attempt``; if it hasn't finished after ``delay``, race it against a second one.
+
+    The first successful result wins and the other attempt is cancelled. An
+    attempt that fails does not end the race while the other is still running.
+    """
+    if delay is None:
+        return await attempt()
+    pending = {asyncio.ensure_future(attempt())}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done and budget.withdraw():
+            logger.debug(f"Hedging request after {delay:.3f}s")
+            pending.add(asyncio.ensure_future(attempt()))
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def with_retries(send: Callable[[], Awaitable[T]], retryable: bool, budget: RetryBudget) -> T:
+    """Retry ``send`` on connection errors with jittered backoff, within the retry budget"""
+    attempt = 0
+    while True:
+        try:
+            return await send()
+        except RETRYABLE_ERRORS:
+            if not retryable or attempt >= RETRY_ATTEMPTS or not budget.withdraw():
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.exceptions import JWKError
+from jose.utils import base64url_decode, base64url_encode
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# JWT Configuration, shared with the auth service
+JWT_SECRET_KEY = os.getenv("jwtSecretKey")
+if not JWT_SECRET_KEY:
+    logger.warning("JWT_SECRET_KEY environment variable not set, using default")
+    JWT_SECRET_KEY = "your-secret-key-here"
+
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
+if not JWT_ALGORITHM:
+    logger.warning("JWT_ALGORITHM environment variable not set, using default")
+    JWT_ALGORITHM = "HS256"
+
+# Gateway token verification configuration
+JWT_ENFORCE_SERVICES = {s.strip() for s in os.getenv("JWT_ENFORCE_SERVICES", "cart").split(",") if s.strip()}
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+# With RS256 or EdDSA tokens, the auth service's public keys replace the shared secret
+JWT_JWKS_URL = os.getenv("JWT_JWKS_URL")  # e.g. http://auth-service:8001/.well-known/jwks.json
+JWT_JWKS_MIN_REFRESH = float(os.getenv("JWT_JWKS_MIN_REFRESH", "30"))
+
+# Identity headers set by the gateway; any client-supplied value is dropped
+USER_ID_HEADER = "x-user-id"
+USER_EMAIL_HEADER = "x-user-email"
+IDENTITY_HEADERS = {USER_ID_HEADER, USER_EMAIL_HEADER}
+
+
+class InvalidToken(Exception):
+    """Raised when a bearer token fails verification"""
+
+
+class Ed25519Key(Key):
+    """EdDSA (Ed25519) public key for python-jose, which only ships HMAC, RSA and EC keys"""
+
+    def __init__(self, key: Any, algorithm: str):
+        if isinstance(key, dict):
+            if key.get("kty") != "OKP" or key.get("crv") != "Ed25519":
+                raise JWKError("Not an Ed25519 JWK")
+            key = ed25519.Ed25519PublicKey.from_public_bytes(base64url_decode(key["x"].encode()))
+        elif isinstance(key, (str, bytes)):
+            try:
+                key = serialization.load_pem_public_key(key.encode() if isinstance(key, str) else key)
+            except ValueError:
+                raise JWKError("Not a PEM encoded public key")
+        if not isinstance(key, ed25519.Ed25519PublicKey):
+            raise JWKError("Not an Ed25519 public key")
+        self._key = key
+
+    def verify(self, msg: bytes, sig: bytes) -> bool:
+        try:
+            self._key.verify(sig, msg)
+            return True
+        except InvalidSignature:
+            return False
+
+    def public_key(self) -> "Ed25519Key":
+        return self
+
+    def to_dict(self) -> Dict[str, str]:
+        raw = self._key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {"alg": "EdDSA", "kty": "OKP", "crv": "Ed25519", "x": base64url_encode(raw).decode()}
+
+
+jwk.register_key("EdDSA", Ed25519Key)
+
+
+class TokenVerifier:
+    """Verify bearer tokens locally with the auth service's key and algorithm.
+
+    Verified payloads are kept in a bounded LRU keyed by a digest of the token
+    and are only served until the token's own ``exp``.
+
+    With ``jwks_url`` set, tokens are verified with the auth service's public
+    keys instead of the shared secret. The key set is fetched at startup and
+    again when its Cache-Control max-age runs out, or sooner (at most every
+    JWT_JWKS_MIN_REFRESH seconds) when a token names an unknown key ID.
+    """
+
+    def __init__(self, secret_key: str = JWT_SECRET_KEY, algorithm: str = JWT_ALGORITHM, cache_size: int = JWT_CACHE_SIZE, jwks_url: Optional[str] = JWT_JWKS_URL):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self.jwks_url = jwks_url
+        self._cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._keys: Dict[str, Tuple[Key, str]] = {}
+        self._etag: Optional[str] = None
+        self._fetched = 0.0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.jwks_url:
+            self._client = httpx.AsyncClient(timeout=5)
+            max_age = await self.refresh()
+            self._refresh_task = asyncio.create_task(self._refresh_loop(max_age))
+
+    async def refresh(self) -> float:
+        """Fetch the key set; returns the seconds until it should be fetched again"""
+        self._fetched = time.monotonic()
+        try:
+            response = await self._client.get(self.jwks_url, headers={"If-None-Match": self._etag} if self._etag else {})
+            if response.status_code != 304:
+                response.raise_for_status()
+                keys = {}
+                for key in response.json().get("keys", []):
+                    algorithm = key.get("alg", "")
+                    # Never let a published key turn into an HMAC secret
+                    if not key.get("kid") or key.get("kty") == "oct" or algorithm.startswith("HS"):
+                        continue
+                    try:
+                        keys[key["kid"]] = (jwk.construct(key, algorithm), algorithm)
+                    except JWKError as e:
+                        logger.error(f"Ignoring JWKS key {key['kid']}: {e}")
+                self._keys = keys
+                self._etag = response.headers.get("etag")
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Failed to fetch JWKS from {self.jwks_url}: {str(e)}")
+            return JWT_JWKS_MIN_REFRESH
+        match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+        return max(JWT_JWKS_MIN_REFRESH, float(match.group(1)) if match else 300.0)
+
+    async def _refresh_loop(self, delay: float) -> None:
+        while True:
+            await asyncio.sleep(delay)
+            delay = await self.refresh()
+
+    def _refresh_soon(self) -> None:
+        """Refetch the key set in the background, e.g. after a rotation, at most every JWT_JWKS_MIN_REFRESH seconds"""
+        if self._client is None or (self._refreshing is not None and not self._refreshing.done()):
+            return
+        if time.monotonic() - self._fetched >= JWT_JWKS_MIN_REFRESH:
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        if not self.jwks_url:
+            return jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in self._keys:
+            self._refresh_soon()
+            raise JWTError("Unknown signing key")
+        key, algorithm = self._keys[kid]
+        return jwt.decode(token, key, algorithms=[algorithm])
+
+    async def close(self) -> None:
+        for task in (self._refresh_task, self._refreshing):
+            if task is not None:
+                task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the token payload or raise InvalidToken"""
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self._cache.get(digest)
+        if cached is not None:
+            payload, expires_at = cached
+            if expires_at > time.time():
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return payload
+            del self._cache[digest]
+
+        self.misses += 1
+        try:
+            payload = self._decode(token)
+        except JWTError as e:
+            raise InvalidToken(str(e))
+        if "purpose" in payload:
+            # Email verification and password reset tokens are not access tokens
+            raise InvalidToken("Not an access token")
+
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            self._cache[digest] = (payload, float(exp))
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return payload
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses, "jwks_keys": len(self._keys)}
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Extract the token from an Authorization header, if it is a bearer token"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+def identity_headers(payload: Dict[str, Any]) -> Dict[str, str]:
+    """Trusted identity headers forwarded to upstreams for a verified token"""
+    headers = {}
+    if payload.get("user_id"):
+        headers[USER_ID_HEADER] = str(payload["user_id"])
+    if payload.get("sub"):
+        headers[USER_EMAIL_HEADER] = str(payload["sub"])
+    return headers
+
+
+# Create a singleton instance
+token_verifier = TokenVerifier()
@@ -1,7 +1,20 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from routes import router
+from routes import router, proxy_request, SERVICES
+from admin import router as admin_router
+from batch import router as batch_router
+from middleware import HeadersMiddleware, CONTENT_SECURITY_POLICY
+from upstream import UpstreamPool
+from shared_state import shared_state
+from cache import response_cache
+from resilience import upstream_guards
+from metrics import MetricsMiddleware, render as render_metrics
+from tracing import TracingMiddleware, close_exporter
+from capture import CAPTURE_ENABLED, CaptureMiddleware, capture_log
+from ratelimit import rate_limiter
+from identity import token_verifier
+from prometheus_client import CONTENT_TYPE_LATEST
 
 app = FastAPI(title="BookShop API Gateway")
 
@@ -16,22 +29,65 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
-# Add CSP middleware
-@app.middleware("http")
-async def add_csp_header(request, call_next):
-    response = await call_next(request)
-    response.headers["Content-Security-Policy"] = "default-src * 'unsafe-inline' 'unsafe-eval'; connect-src *; img-src * data:; script-src * 'unsafe-inline' 'unsafe-eval'; style-src * 'unsafe-inline';"
-    return response
+# Add CSP header to every response
+app.add_middleware(HeadersMiddleware, headers={"Content-Security-Policy": CONTENT_SECURITY_POLICY})
+
+# Trace context propagation and Server-Timing
+app.add_middleware(TracingMiddleware, name="gateway")
+
+# Request metrics, labelled by service and route template
+app.add_middleware(MetricsMiddleware, services=SERVICES, proxy_endpoint=proxy_request)
+
+# Opt-in traffic capture for benchmarks/replay.py
+if CAPTURE_ENABLED:
+    app.add_middleware(CaptureMiddleware, services=SERVICES)
 
 # Add OPTIONS handler for preflight requests
 @app.options("/{full_path:path}")
 async def options_handler():
     return {}
 
-# Include router
+# Include routers (admin and batch first so the catch-all proxy route doesn't shadow them)
+app.include_router(admin_router)
+app.include_router(batch_router)
 app.include_router(router)
 
+# Startup and shutdown events
+@app.on_event("startup")
+async def startup_event():
+    await UpstreamPool.start(SERVICES)
+    await shared_state.start()
+    await token_verifier.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await shared_state.close()
+    await UpstreamPool.close()
+    await rate_limiter.close()
+    await token_verifier.close()
+    close_exporter()
+    capture_log.close()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "api-gateway"}
\ No newline at end of file
+    return {"status": "ok", "service": "api-gateway"}
+
+# Response cache statistics
+@app.get("/cache-stats")
+async def cache_stats():
+    return response_cache.stats()
+
+# Upstream instances, bulkhead and circuit breaker state
+@app.get("/upstreams")
+async def upstream_stats():
+    guards = upstream_guards.stats()
+    return {
+        service: {**guards.get(service, {}), "instances": instances}
+        for service, instances in shared_state.stats().items()
+    }
+
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
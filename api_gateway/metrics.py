@@ -0,0 +1,278 @@
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from route_templates import route_template
+from upstream import UpstreamPool
+from resilience import upstream_guards
+from cache import response_cache
+from coalesce import single_flight
+from ratelimit import rate_limiter
+
+# Methods outside this set are reported as OTHER so clients can't invent label values
+METRIC_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# Label used for requests handled by the gateway itself rather than proxied
+GATEWAY_SERVICE = "gateway"
+
+REQUESTS = Counter(
+    "gateway_requests_total",
+    "Requests handled by the gateway",
+    ["service", "method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "gateway_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of the response",
+    ["service", "method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "gateway_requests_in_flight",
+    "Requests currently being handled",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+REQUEST_BYTES = Counter(
+    "gateway_request_bytes_total",
+    "Request body bytes received from clients",
+    ["service"],
+)
+RESPONSE_BYTES = Counter(
+    "gateway_response_bytes_total",
+    "Response body bytes sent to clients",
+    ["service"],
+)
+UPSTREAM_CONNECT = Histogram(
+    "gateway_upstream_connect_seconds",
+    "Time to open a new connection (TCP and TLS) to an upstream instance",
+    ["service", "instance"],
+)
+UPSTREAM_TTFB = Histogram(
+    "gateway_upstream_ttfb_seconds",
+    "Time from sending an upstream request to receiving the response headers",
+    ["service", "instance"],
+)
+UPSTREAM_DURATION = Histogram(
+    "gateway_upstream_duration_seconds",
+    "Time from sending an upstream request to reading the last byte of its body",
+    ["service", "instance"],
+)
+
+
+class UpstreamTimer:
+    """Connect, time-to-first-byte and total time of one upstream call.
+
+    ``trace`` is passed to httpx as the ``trace`` request extension, which
+    httpcore calls at each step of the connection and the exchange.
+    """
+
+    def __init__(self, service: str, instance: str):
+        self.service = service
+        self.instance = instance
+        self.started = time.perf_counter()
+        self._connect_started: Optional[float] = None
+        self._connected = self.started
+        self._finished = False
+
+    async def trace(self, event: str, info: Dict[str, object]) -> None:
+        now = time.perf_counter()
+        if event == "connection.connect_tcp.started":
+            self._connect_started = now
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self._connected = now
+        elif event.endswith(".send_request_headers.started") and self._connect_started is not None:
+            # A new connection was opened for this request (TLS included when used)
+            UPSTREAM_CONNECT.labels(self.service, self.instance).observe(self._connected - self._connect_started)
+            self._connect_started = None
+        elif event.endswith(".receive_response_headers.complete"):
+            UPSTREAM_TTFB.labels(self.service, self.instance).observe(now - self.started)
+
+    def finish(self) -> None:
+        if not self._finished:
+            self._finished = True
+            UPSTREAM_DURATION.labels(self.service, self.instance).observe(time.perf_counter() - self.started)
+
+
+class GatewayCollector:
+    """Exports state the gateway already keeps (pools, instances, breakers, cache) at scrape time"""
+
+    def collect(self) -> Iterable:
+        connections = GaugeMetricFamily(
+            "gateway_upstream_pool_connections",
+            "Pooled connections per upstream instance",
+            labels=["service", "instance", "state"],
+        )
+        outstanding = GaugeMetricFamily(
+            "gateway_upstream_in_flight",
+            "Requests in flight to an upstream instance",
+            labels=["service", "instance"],
+        )
+        healthy = GaugeMetricFamily(
+            "gateway_upstream_healthy",
+            "1 if the instance passes health checks and is not draining",
+            labels=["service", "instance"],
+        )
+        for service, instances in UpstreamPool.instances.items():
+            for instance in instances:
+                in_use, idle = _pool_usage(instance.client)
+                connections.add_metric([service, instance.url, "in_use"], in_use)
+                connections.add_metric([service, instance.url, "idle"], idle)
+                outstanding.add_metric([service, instance.url], instance.outstanding)
+                healthy.add_metric([service, instance.url], 1 if instance.available else 0)
+        yield connections
+        yield outstanding
+        yield healthy
+
+        breaker = GaugeMetricFamily(
+            "gateway_circuit_breaker_open",
+            "Circuit breaker state (0 closed, 0.5 half open, 1 open)",
+            labels=["service"],
+        )
+        queued = GaugeMetricFamily("gateway_bulkhead_queued", "Requests waiting for a bulkhead slot", labels=["service"])
+        rejected = CounterMetricFamily("gateway_bulkhead_rejected", "Requests shed by a bulkhead or open breaker", labels=["service"])
+        class_in_flight = GaugeMetricFamily(
+            "gateway_bulkhead_class_in_flight",
+            "Upstream calls in flight per priority class",
+            labels=["service", "class"],
+        )
+        class_queued = GaugeMetricFamily(
+            "gateway_bulkhead_class_queued",
+            "Requests waiting for a bulkhead slot per priority class",
+            labels=["service", "class"],
+        )
+        class_shed = CounterMetricFamily(
+            "gateway_bulkhead_shed",
+            "Requests shed by a bulkhead per priority class",
+            labels=["service", "class"],
+        )
+        for service, stats in upstream_guards.stats().items():
+            breaker.add_metric([service], {"closed": 0, "half_open": 0.5, "open": 1}.get(stats["state"], 0))
+            queued.add_metric([service], stats["queued"])
+            rejected.add_metric([service], stats["rejected"])
+            for name, counts in stats["classes"].items():
+                class_in_flight.add_metric([service, name], counts["inflight"])
+                class_queued.add_metric([service, name], counts["queued"])
+                class_shed.add_metric([service, name], counts["shed"])
+        yield breaker
+        yield queued
+        yield rejected
+        yield class_in_flight
+        yield class_queued
+        yield class_shed
+
+        cache = response_cache.stats()
+        yield GaugeMetricFamily("gateway_cache_entries", "Cached responses", value=cache["entries"])
+        yield GaugeMetricFamily("gateway_cache_bytes", "Memory used by cached responses", value=cache["bytes"])
+        yield CounterMetricFamily("gateway_cache_hits", "Cache lookups that found an entry", value=cache["hits"])
+        yield CounterMetricFamily("gateway_cache_misses", "Cache lookups that found nothing", value=cache["misses"])
+        yield CounterMetricFamily("gateway_cache_evictions", "Entries evicted to stay within limits", value=cache["evictions"])
+
+        flights = single_flight.stats()
+        yield CounterMetricFamily("gateway_coalesced_requests", "Requests served by another request's upstream call", value=flights["coalesced"])
+
+        limits = rate_limiter.stats()
+        yield CounterMetricFamily("gateway_rate_limited", "Requests refused with 429 by a rate limit", value=limits["limited"])
+        yield CounterMetricFamily("gateway_rate_limit_errors", "Rate limit checks skipped because the backend failed", value=limits["errors"])
+
+
+def _pool_usage(client) -> Tuple[int, int]:
+    """In-use and idle connections of an httpx client's pool (0, 0 if the transport isn't pooled)"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    in_use = idle = 0
+    for connection in getattr(pool, "connections", []):
+        if connection.is_closed():
+            continue
+        if connection.is_idle():
+            idle += 1
+        else:
+            in_use += 1
+    return in_use, idle
+
+
+gateway_collector = GatewayCollector()
+REGISTRY.register(gateway_collector)
+
+
+def render() -> bytes:
+    """Metrics in the Prometheus text format.
+
+    With several gunicorn workers (PROMETHEUS_MULTIPROC_DIR set), request and
+    upstream metrics are aggregated over all workers. The pool, breaker and
+    cache metrics are only known in-process and describe the worker that
+    served the scrape.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(gateway_collector)
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request count, latency, size and in-flight requests.
+
+    Proxied requests are labelled with their service and route template;
+    the gateway's own endpoints with their route path. Anything that didn't
+    match a route is reported as "other", so label cardinality is bounded by
+    the configuration, not by what clients send.
+    """
+
+    def __init__(self, app: ASGIApp, services: Iterable[str], proxy_endpoint: Callable):
+        self.app = app
+        self.services: Set[str] = set(services)
+        self.proxy_endpoint = proxy_endpoint
+        self._route_paths: Dict[Callable, str] = {}
+
+    def _route(self, scope: Scope, service: str) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "other"
+        if endpoint is self.proxy_endpoint and service != GATEWAY_SERVICE:
+            return route_template(service, scope.get("path_params", {}).get("path", ""))
+        if not self._route_paths:
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(endpoint, "other")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        first = scope["path"].split("/", 2)[1] if scope["path"].startswith("/") else ""
+        service = first if first in self.services else GATEWAY_SERVICE
+        method = scope["method"] if scope["method"] in METRIC_METHODS else "OTHER"
+        status_code = 500
+        received = sent = 0
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(service)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            duration = time.perf_counter() - started
+            in_flight.dec()
+            labels = (service, method, self._route(scope, service), str(status_code))
+            REQUESTS.labels(*labels).inc()
+            REQUEST_DURATION.labels(*labels).observe(duration)
+            REQUEST_BYTES.labels(service).inc(received)
+            RESPONSE_BYTES.labels(service).inc(sent)
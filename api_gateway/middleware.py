@@ -0,0 +1,40 @@
+from typing import Dict, List, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Content-Security-Policy sent with every gateway response
+CONTENT_SECURITY_POLICY = (
+    "default-src * 'unsafe-inline' 'unsafe-eval'; connect-src *; img-src * data:; "
+    "script-src * 'unsafe-inline' 'unsafe-eval'; style-src * 'unsafe-inline';"
+)
+
+
+class HeadersMiddleware:
+    """Pure ASGI middleware that sets fixed headers on every HTTP response.
+
+    The headers are encoded once at startup and appended to the
+    ``http.response.start`` message, so responses (including streamed ones)
+    pass through untouched instead of being re-wrapped per request the way
+    ``@app.middleware("http")`` does. A header the app already set with the
+    same name is replaced.
+    """
+
+    def __init__(self, app: ASGIApp, headers: Dict[str, str]):
+        self.app = app
+        self.raw_headers: List[Tuple[bytes, bytes]] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()
+        ]
+        self.names = {name for name, _ in self.raw_headers}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [h for h in message.get("headers", ()) if h[0].lower() not in self.names]
+                headers.extend(self.raw_headers)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,268 @@
+import fnmatch
+import ipaddress
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# redis is optional; it is only needed for the shared backend
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# Rate limit configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+# key:service:method:path:count/seconds[:burst], first match per key type wins. "ip" rules apply to
+# every request per client address, "subject" rules on top of them to authenticated requests per
+# token subject, so a token doesn't lift the per-address limits on logins and password resets.
+RATE_LIMIT_RULES = os.getenv(
+    "RATE_LIMIT_RULES",
+    "ip:auth:POST:/login:10/60,ip:auth:POST:/forgot-password:5/300,ip:*:*:*:20/1:50,subject:*:*:*:30/1:60",
+)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.05"))
+RATE_LIMIT_KEY_PREFIX = os.getenv("RATE_LIMIT_KEY_PREFIX", "gateway:ratelimit:")
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    key: str  # "ip" or "subject"
+    service: str
+    method: str
+    path: str
+    count: int
+    seconds: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second"""
+        return self.count / self.seconds
+
+    def matches(self, service: str, method: str, path: str) -> bool:
+        return (
+            self.service in ("*", service)
+            and self.method in ("*", method)
+            and fnmatch.fnmatchcase(path, self.path)
+        )
+
+
+@dataclass
+class RateLimitDecision:
+    rule: RateLimitRule
+    allowed: bool
+    tokens: float  # left in the bucket after this request
+
+    def headers(self) -> Dict[str, str]:
+        """RateLimit-* headers (IETF httpapi draft), plus Retry-After when the request was refused"""
+        rule = self.rule
+        headers = {
+            "RateLimit-Limit": str(rule.burst),
+            "RateLimit-Remaining": str(max(0, int(self.tokens))),
+            # Seconds until the bucket is full again
+            "RateLimit-Reset": str(max(0, math.ceil((rule.burst - self.tokens) / rule.rate))),
+            "RateLimit-Policy": f"{rule.count};w={rule.seconds:g};burst={rule.burst}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil((1 - self.tokens) / rule.rate)))
+        return headers
+
+
+class RateLimitBackend(ABC):
+    """Storage of token buckets. ``take`` refills a bucket, removes a token if there is one and
+    returns (allowed, tokens left); the refill and the take must be atomic."""
+
+    @abstractmethod
+    async def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(RateLimitBackend):
+    """Buckets in this worker's memory, least recently used evicted beyond ``max_keys``.
+
+    Each gateway worker counts on its own, so with N workers a client can
+    get up to N times the configured rate.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(capacity), now))
+        tokens = min(float(capacity), tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+# Refill and take in one step on the server, using the server's clock so workers' clocks don't matter
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    """Buckets shared by all gateway workers and instances in Redis (or a Redis-compatible server)"""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, timeout: float = RATE_LIMIT_REDIS_TIMEOUT, prefix: str = RATE_LIMIT_KEY_PREFIX):
+        if aioredis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package")
+        self.prefix = prefix
+        self._client = aioredis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        allowed, tokens = await self._take(keys=[self.prefix + key], args=[capacity, rate])
+        return bool(allowed), float(tokens)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def client_address(request: Request) -> str:
+    """Client address used as the "ip" key; IPv6 clients are grouped by their /64"""
+    host = request.client.host if request.client else "unknown"
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host
+    if address.version == 6:
+        if address.ipv4_mapped is not None:
+            return str(address.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{host}/64", strict=False))
+    return host
+
+
+class RateLimiter:
+    """Token buckets per client address, and per token subject for authenticated requests.
+
+    Each request takes a token from the first "ip" rule that matches its
+    service, method and path and, when it carries a valid token, from the
+    first matching "subject" rule as well; every rule has its own buckets.
+    If the backend fails the request is let through.
+    """
+
+    def __init__(self, rules: str = RATE_LIMIT_RULES, backend: Optional[RateLimitBackend] = None):
+        self.rules = self._parse_rules(rules)
+        self.backend = backend
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+        self._error_logged = 0.0
+
+    @staticmethod
+    def _parse_rules(value: str) -> List[RateLimitRule]:
+        rules: List[RateLimitRule] = []
+        for item in value.split(","):
+            parts = item.strip().split(":")
+            if parts == [""]:
+                continue
+            try:
+                if len(parts) not in (5, 6) or parts[0] not in ("ip", "subject"):
+                    raise ValueError(item)
+                count, _, seconds = parts[4].partition("/")
+                rule = RateLimitRule(
+                    parts[0], parts[1], parts[2].upper(), parts[3],
+                    int(count), float(seconds or 1), int(parts[5]) if len(parts) == 6 else int(count),
+                )
+                if rule.count <= 0 or rule.seconds <= 0 or rule.burst <= 0:
+                    raise ValueError(item)
+                rules.append(rule)
+            except ValueError:
+                logger.error(f"Ignoring invalid rate limit rule: {item}")
+        return rules
+
+    def _backend(self) -> RateLimitBackend:
+        if self.backend is None:
+            self.backend = RedisBackend() if RATE_LIMIT_BACKEND == "redis" else MemoryBackend()
+        return self.backend
+
+    async def check(self, service: str, method: str, path: str, request: Request, subject: Optional[str]) -> Optional[RateLimitDecision]:
+        """Take tokens for the request; None if no rule applies. ``path`` is the path within the service.
+
+        The refused decision is returned if there is one, otherwise the one with the fewest tokens left.
+        """
+        if not RATE_LIMIT_ENABLED:
+            return None
+        decisions: List[RateLimitDecision] = []
+        for key_type, identity in (("ip", client_address(request)), ("subject", subject)):
+            if identity is None:
+                continue
+            decision = await self._take(key_type, identity, service, method, path)
+            if decision is None:
+                continue
+            if not decision.allowed:
+                self.limited += 1
+                return decision
+            decisions.append(decision)
+        if not decisions:
+            return None
+        self.allowed += 1
+        return min(decisions, key=lambda decision: decision.tokens)
+
+    async def _take(self, key_type: str, identity: str, service: str, method: str, path: str) -> Optional[RateLimitDecision]:
+        """Take a token under the first rule of ``key_type`` that matches; None if none does or the backend failed"""
+        for index, rule in enumerate(self.rules):
+            if rule.key == key_type and rule.matches(service, method, path):
+                break
+        else:
+            return None
+
+        try:
+            allowed, tokens = await self._backend().take(f"{index}:{identity}", rule.burst, rule.rate)
+        except Exception as e:
+            self.errors += 1
+            if time.monotonic() - self._error_logged > 10:
+                # Once per 10 seconds, an unreachable backend would otherwise log every request
+                self._error_logged = time.monotonic()
+                logger.error(f"Rate limit backend failed, letting requests through: {str(e)}")
+            return None
+        return RateLimitDecision(rule, allowed, tokens)
+
+    def stats(self) -> Dict[str, int]:
+        return {"allowed": self.allowed, "limited": self.limited, "errors": self.errors}
+
+    async def close(self) -> None:
+        if self.backend is not None:
+            await self.backend.close()
+            self.backend = None
+
+
+# Create a singleton instance
+rate_limiter = RateLimiter()
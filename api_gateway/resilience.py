@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from admission import PRIORITY_SHED_STATUS, PriorityClass, priority_classifier
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def service_setting(name: str, service: str, default: str) -> str:
+    """Read NAME_<SERVICE> from the environment, falling back to NAME and then the default"""
+    return os.getenv(f"{name}_{service.upper()}", os.getenv(name, default))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when the gateway refuses to call an upstream"""
+
+    def __init__(self, service: str, reason: str, retry_after: int, status_code: int = 503):
+        super().__init__(f"Service {service} is {reason}")
+        self.service = service
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class Bulkhead:
+    """Cap concurrent upstream calls and bound the queue of callers waiting for a slot.
+
+    Callers wait in one queue per priority class. A freed slot goes to the
+    waiting class using the smallest part of its weight, so under contention
+    the classes share the concurrency in proportion to their weights. The
+    lowest classes are shed first: of ``levels`` classes, the one at rank r
+    may only queue while fewer than (levels - r) / levels of ``max_queue``
+    are waiting, and a class at its limit makes room by shedding the newest
+    waiter of the lowest class below it.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        max_inflight: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+        levels: int = 1,
+        shed_status: int = 503,
+    ):
+        self.service = service
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.levels = max(1, levels)
+        self.shed_status = shed_status
+        self.inflight = 0
+        self.rejected = 0
+        self._inflight_by_class: Dict[PriorityClass, int] = {}
+        self._waiters: Dict[PriorityClass, Deque[asyncio.Future]] = {}
+        self._shed: Dict[str, int] = {}
+
+    async def acquire(self, priority: PriorityClass) -> None:
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            self._inflight_by_class[priority] = self._inflight_by_class.get(priority, 0) + 1
+            return
+        if self.queued >= self._queue_limit(priority) and not self._shed_below(priority):
+            self._count_shed(priority)
+            raise UpstreamUnavailable(
+                self.service, "overloaded", self.retry_after, 503 if priority.rank == 0 else self.shed_status
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(priority, deque())
+        waiters.append(waiter)
+        try:
+            # release() hands its slot over by resolving the waiter, _shed_below() fails it
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._count_shed(priority)
+            raise UpstreamUnavailable(self.service, "overloaded", self.retry_after)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(priority)
+            raise
+        finally:
+            if waiter in waiters:
+                waiters.remove(waiter)
+
+    def release(self, priority: PriorityClass) -> None:
+        self._inflight_by_class[priority] -= 1
+        while True:
+            waiting = [c for c, waiters in self._waiters.items() if waiters]
+            if not waiting:
+                break
+            chosen = min(waiting, key=lambda c: (self._inflight_by_class.get(c, 0) / c.weight, c.rank))
+            waiter = self._waiters[chosen].popleft()
+            if not waiter.done():
+                self._inflight_by_class[chosen] = self._inflight_by_class.get(chosen, 0) + 1
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def _queue_limit(self, priority: PriorityClass) -> float:
+        return self.max_queue * (self.levels - min(priority.rank, self.levels - 1)) / self.levels
+
+    def _shed_below(self, priority: PriorityClass) -> bool:
+        """Fail the newest waiter of the lowest class below ``priority``; False if there is none"""
+        for victim in sorted(self._waiters, key=lambda c: c.rank, reverse=True):
+            if victim.rank <= priority.rank:
+                break
+            waiters = self._waiters[victim]
+            while waiters:
+                waiter = waiters.pop()
+                if not waiter.done():
+                    self._count_shed(victim)
+                    waiter.set_exception(UpstreamUnavailable(self.service, "overloaded", self.retry_after, self.shed_status))
+                    return True
+        return False
+
+    def _count_shed(self, priority: PriorityClass) -> None:
+        self.rejected += 1
+        self._shed[priority.name] = self._shed.get(priority.name, 0) + 1
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def class_stats(self) -> Dict[str, Dict[str, int]]:
+        names = {c.name for c in self._inflight_by_class} | {c.name for c in self._waiters} | set(self._shed)
+        stats = {name: {"inflight": 0, "queued": 0, "shed": self._shed.get(name, 0)} for name in names}
+        for priority, count in self._inflight_by_class.items():
+            stats[priority.name]["inflight"] += count
+        for priority, waiters in self._waiters.items():
+            stats[priority.name]["queued"] += len(waiters)
+        return stats
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by error rate and slow-call rate.
+
+    Outcomes are kept for a rolling window. Once at least ``min_requests``
+    calls are in the window and either rate crosses its threshold, the
+    breaker opens and calls fail fast for ``open_seconds``. It then lets
+    ``half_open_probes`` calls through; if they all succeed it closes again,
+    any failure reopens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        service: str,
+        window: float,
+        min_requests: int,
+        error_rate: float,
+        slow_call_seconds: float,
+        slow_call_rate: float,
+        open_seconds: float,
+        half_open_probes: int,
+    ):
+        self.service = service
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.transitions = 0
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._probes_inflight = 0
+        self._probe_successes = 0
+
+    def before_call(self) -> None:
+        """Raise UpstreamUnavailable if the breaker does not allow a call right now"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailable(self.service, "unavailable (circuit open)", max(1, math.ceil(remaining)))
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probes_inflight >= self.half_open_probes:
+                raise UpstreamUnavailable(self.service, "unavailable (circuit half-open)", 1)
+            self._probes_inflight += 1
+
+    def after_call(self, failed: Optional[bool], duration: float) -> None:
+        """Record a call outcome; ``failed=None`` means the caller went away and nothing is recorded"""
+        if self.state == self.HALF_OPEN:
+            self._probes_inflight = max(0, self._probes_inflight - 1)
+            if failed is None:
+                return
+            if failed:
+                self._transition(self.OPEN)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(self.CLOSED)
+            return
+        if failed is None or self.state != self.CLOSED:
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed, duration >= self.slow_call_seconds))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+        total = len(self._outcomes)
+        if total < self.min_requests:
+            return
+        errors = sum(1 for _, f, _ in self._outcomes if f)
+        slow = sum(1 for _, _, s in self._outcomes if s)
+        if errors / total >= self.error_rate or slow / total >= self.slow_call_rate:
+            self._transition(self.OPEN)
+
+    def _transition(self, state: str) -> None:
+        logger.warning(f"Circuit breaker for {self.service} changed from {self.state} to {state}")
+        self.state = state
+        self.transitions += 1
+        self._outcomes.clear()
+        self._probes_inflight = 0
+        self._probe_successes = 0
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """Bulkhead plus circuit breaker protecting one upstream service"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.bulkhead = Bulkhead(
+            service,
+            max_inflight=int(service_setting("BULKHEAD_MAX_INFLIGHT", service, "100")),
+            max_queue=int(service_setting("BULKHEAD_MAX_QUEUE", service, "200")),
+            queue_timeout=float(service_setting("BULKHEAD_QUEUE_TIMEOUT", service, "5")),
+            retry_after=int(service_setting("BULKHEAD_RETRY_AFTER", service, "1")),
+            levels=len(priority_classifier.classes),
+            shed_status=PRIORITY_SHED_STATUS,
+        )
+        self.breaker = CircuitBreaker(
+            service,
+            window=float(service_setting("BREAKER_WINDOW", service, "30")),
+            min_requests=int(service_setting("BREAKER_MIN_REQUESTS", service, "20")),
+            error_rate=float(service_setting("BREAKER_ERROR_RATE", service, "0.5")),
+            slow_call_seconds=float(service_setting("BREAKER_SLOW_CALL_SECONDS", service, "5")),
+            slow_call_rate=float(service_setting("BREAKER_SLOW_CALL_RATE", service, "0.5")),
+            open_seconds=float(service_setting("BREAKER_OPEN_SECONDS", service, "15")),
+            half_open_probes=int(service_setting("BREAKER_HALF_OPEN_PROBES", service, "3")),
+        )
+
+    async def acquire(self, priority: PriorityClass) -> float:
+        """Wait for permission to call the upstream and return the start time"""
+        self.breaker.before_call()
+        try:
+            await self.bulkhead.acquire(priority)
+        except BaseException:
+            # The call never happened, give the probe slot back without recording anything
+            self.breaker.after_call(None, 0.0)
+            raise
+        return time.monotonic()
+
+    def release(self, priority: PriorityClass, started: float, failed: Optional[bool]) -> None:
+        self.bulkhead.release(priority)
+        self.breaker.after_call(failed, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.breaker.state,
+            "transitions": self.breaker.transitions,
+            "inflight": self.bulkhead.inflight,
+            "queued": self.bulkhead.queued,
+            "max_inflight": self.bulkhead.max_inflight,
+            "max_queue": self.bulkhead.max_queue,
+            "rejected": self.bulkhead.rejected,
+            "classes": self.bulkhead.class_stats(),
+        }
+
+
+class UpstreamGuards:
+    """Lazily created guard per service (asyncio primitives need a running loop)"""
+
+    def __init__(self):
+        self._guards: Dict[str, UpstreamGuard] = {}
+
+    def get(self, service: str) -> UpstreamGuard:
+        guard = self._guards.get(service)
+        if guard is None:
+            guard = self._guards[service] = UpstreamGuard(service)
+        return guard
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {service: guard.stats() for service, guard in self._guards.items()}
+
+
+# Create a singleton instance
+upstream_guards = UpstreamGuards()
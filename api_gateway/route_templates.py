@@ -0,0 +1,42 @@
+import os
+import re
+from typing import Set
+
+# Route template configuration
+ROUTE_TEMPLATE_DEPTH = int(os.getenv("ROUTE_TEMPLATE_DEPTH", "2"))
+ROUTE_TEMPLATE_MAX = int(os.getenv("ROUTE_TEMPLATE_MAX", "200"))
+
+# Path segments that identify a resource rather than a route
+_ID_PATTERN = re.compile(
+    r"^(?:[0-9]+|[0-9a-fA-F]{24}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|.{33,})$"
+)
+
+_known: Set[str] = set()
+
+
+def _segment(segment: str) -> str:
+    if _ID_PATTERN.match(segment):
+        return ":id"
+    if "." in segment:
+        return ":file"
+    return segment
+
+
+def route_template(service: str, path: str) -> str:
+    """Collapse a proxied path into a low-cardinality route template.
+
+    IDs and file names become placeholders, only the first
+    ROUTE_TEMPLATE_DEPTH segments are kept, and once ROUTE_TEMPLATE_MAX
+    distinct templates have been seen any new one is reported as "other",
+    so the catch-all proxy route can't blow up per-route state.
+    """
+    segments = [s for s in path.split("/") if s]
+    parts = [_segment(s) for s in segments[:ROUTE_TEMPLATE_DEPTH]]
+    if len(segments) > ROUTE_TEMPLATE_DEPTH:
+        parts.append("*")
+    template = "/" + "/".join([service] + parts)
+    if template not in _known:
+        if len(_known) >= ROUTE_TEMPLATE_MAX:
+            return f"/{service}/other"
+        _known.add(template)
+    return template
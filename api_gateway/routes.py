@@ -1,25 +1,194 @@
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import Response, JSONResponse, HTMLResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+import asyncio
+import fnmatch
+import posixpath
+import time
 import httpx
 import os
 import logging
+from upstream import NoAvailableInstance, UpstreamInstance, UpstreamPool
+from resilience import UpstreamGuard, UpstreamUnavailable, upstream_guards
+from admission import PriorityClass, priority_classifier
+from ratelimit import rate_limiter
+from cache import response_cache, parse_cache_control, INVALIDATING_METHODS
+from coalesce import single_flight
+from shared_state import shared_state
+from hedging import (
+    HEDGE_SERVICES,
+    IDEMPOTENT_METHODS,
+    hedge_delay,
+    hedged,
+    latency_tracker,
+    retry_budget,
+    with_retries
+)
+from route_templates import route_template
+from metrics import UpstreamTimer
+from tracing import inject, span
+from compression import (
+    COMPRESSION_ENABLED,
+    add_vary,
+    choose_encoding,
+    compress,
+    compress_stream,
+    compressible,
+    encoded_etag,
+    encoded_headers
+)
+from identity import (
+    IDENTITY_HEADERS,
+    JWT_ENFORCE_SERVICES,
+    InvalidToken,
+    bearer_token,
+    identity_headers,
+    token_verifier
+)
+from conditional import (
+    CONDITIONAL_METHODS,
+    CONDITIONAL_REQUEST_HEADERS,
+    ETAG_SERVICES,
+    apply_cache_policy,
+    compute_etag,
+    etag_enabled,
+    if_none_match,
+    not_modified
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def _service_urls(name: str, default: str) -> List[str]:
+    """Read a comma-separated list of instance URLs for a service"""
+    return [url.strip().rstrip("/") for url in os.getenv(name, default).split(",") if url.strip()]
+
+
 # Get service URLs from environment variables with fallbacks
 SERVICES = {
-    "auth": os.getenv("AUTH_SERVICE_URL", "http://auth-service:8001"),
-    "book": os.getenv("BOOK_SERVICE_URL", "http://book-service:8002"),
-    "cart": os.getenv("CART_SERVICE_URL", "http://cart-service:8003")
+    "auth": _service_urls("AUTH_SERVICE_URL", "http://auth-service:8001"),
+    "book": _service_urls("BOOK_SERVICE_URL", "http://book-service:8002"),
+    "cart": _service_urls("CART_SERVICE_URL", "http://cart-service:8003")
+}
+
+# Streaming configuration
+PROXY_STREAMING = os.getenv("PROXY_STREAMING", "True").lower() == "true"
+PROXY_MAX_BODY_SIZE = int(os.getenv("PROXY_MAX_BODY_SIZE", str(10 * 1024 * 1024)))
+# Responses that would be buffered (for ETags, caching, coalescing or hedging) are streamed instead
+# when they are larger than this, of unknown length, or marked no-store
+PROXY_BUFFER_MAX_SIZE = int(os.getenv("PROXY_BUFFER_MAX_SIZE", str(1024 * 1024)))
+
+# service:path globs of internal upstream endpoints that are never proxied, e.g. metrics
+PROXY_BLOCKED_PATHS = [
+    tuple(item.strip().split(":", 1))
+    for item in os.getenv("PROXY_BLOCKED_PATHS", "auth:/metrics,auth:/metrics/*").split(",")
+    if ":" in item
+]
+
+# Headers that only apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
 }
 
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds PROXY_MAX_BODY_SIZE"""
+
+
+class UpstreamStream:
+    """An upstream response whose body hasn't been read yet.
+
+    It holds its instance and bulkhead slot until closed, which happens
+    once the body has been relayed to the client.
+    """
+
+    def __init__(
+        self,
+        instance: UpstreamInstance,
+        response: httpx.Response,
+        guard: UpstreamGuard,
+        priority: PriorityClass,
+        started: float,
+        timer: UpstreamTimer,
+    ):
+        self.instance = instance
+        self.response = response
+        self.guard = guard
+        self.priority = priority
+        self.started = started
+        self.timer = timer
+        self._released = False
+
+    async def aclose(self) -> None:
+        await self.response.aclose()
+        if not self._released:
+            self._released = True
+            self.timer.finish()
+            self.instance.outstanding -= 1
+            self.guard.release(self.priority, self.started, self.response.status_code >= 500)
+
+
+def _blocked(service: str, path: str) -> bool:
+    """Whether ``path`` (within the service) matches PROXY_BLOCKED_PATHS, after resolving "." and ".." segments"""
+    normalized = posixpath.normpath("/" + path.lstrip("/"))
+    return any(
+        blocked_service in ("*", service) and fnmatch.fnmatchcase(normalized.lower(), pattern.lower())
+        for blocked_service, pattern in PROXY_BLOCKED_PATHS
+    )
+
+
+def _response_headers(response: httpx.Response) -> Dict[str, str]:
+    """Copy upstream response headers without hop-by-hop headers"""
+    return {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+async def _read_raw(response: httpx.Response) -> bytes:
+    """Read the upstream body as sent on the wire, without decoding it.
+
+    Keeping the original bytes means content-length and content-encoding
+    copied from the upstream stay correct.
+    """
+    return b"".join([chunk async for chunk in response.aiter_raw()])
+
+
+def _too_large_to_buffer(response: httpx.Response) -> bool:
+    """Whether a response meant to be buffered should be streamed: over PROXY_BUFFER_MAX_SIZE,
+    of unknown length, or one the upstream says must not be stored"""
+    if not PROXY_STREAMING:
+        return False
+    length = response.headers.get("content-length")
+    if not (length and length.isdigit() and int(length) <= PROXY_BUFFER_MAX_SIZE):
+        return True
+    return "no-store" in parse_cache_control(response.headers.get("cache-control", ""))
+
+
+async def _limited_body(request: Request) -> AsyncIterator[bytes]:
+    """Yield the incoming request body, enforcing PROXY_MAX_BODY_SIZE"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > PROXY_MAX_BODY_SIZE:
+            raise BodyTooLarge()
+        yield chunk
+
+
 @router.api_route("/{service}/{path:path}", methods=["GET", "POST", "PATCH", "PUT", "DELETE", "OPTIONS"])
 async def proxy_request(service: str, path: str, request: Request):
     if service not in SERVICES:
         raise HTTPException(status_code=400, detail="Invalid service")
+    if _blocked(service, path):
+        raise HTTPException(status_code=404, detail="Not Found")
 
     # Handle OPTIONS request
     if request.method == "OPTIONS":
@@ -33,51 +202,337 @@ async def proxy_request(service: str, path: str, request: Request):
             }
         )
 
-    url = f"{SERVICES[service]}/{path}"
-    headers = dict(request.headers)
-    body = await request.body()
+    # Reject oversized bodies before contacting the upstream
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > PROXY_MAX_BODY_SIZE:
+        raise HTTPException(status_code=413, detail="Request body too large")
+
+    headers = {k: v for k, v in request.headers.items() if k not in IDENTITY_HEADERS}
+    if COMPRESSION_ENABLED:
+        # The gateway negotiates compression itself, so upstreams always send plain bodies
+        headers["accept-encoding"] = "identity"
+    else:
+        # Bodies are forwarded undecoded, so never let httpx ask for an encoding the client didn't
+        headers.setdefault("accept-encoding", "identity")
     params = dict(request.query_params)
 
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Log the request method and URL for debugging
-            logger.info(f"Proxying {request.method} request to {url}")
-            
-            response = await client.request(
-                method=request.method,
-                url=url,
-                headers=headers,
-                params=params,
-                content=body,
-                follow_redirects=False
+    # Verify bearer tokens locally and tell upstreams who the caller is
+    token = bearer_token(request.headers.get("authorization"))
+    payload = None
+    if token:
+        try:
+            payload = token_verifier.verify(token)
+            headers.update(identity_headers(payload))
+        except InvalidToken:
+            if service in JWT_ENFORCE_SERVICES:
+                raise HTTPException(status_code=401, detail="Invalid token")
+
+    # Token buckets per client address, or per user for authenticated requests
+    subject = str(payload["sub"]) if payload and payload.get("sub") else None
+    limit = await rate_limiter.check(service, request.method, f"/{path}", request, subject)
+    if limit is not None and not limit.allowed:
+        raise HTTPException(status_code=429, detail="Too many requests", headers=limit.headers())
+
+    # Serve catalogue reads from the gateway cache when possible
+    cache_key = response_cache.key_for(service, path, request, headers["accept-encoding"])
+    if cache_key is not None:
+        cached = response_cache.get(cache_key, request)
+        if cached is not None:
+            response = await _client_response(
+                service, request, cached.status_code, cached.response_headers(), cached.body, cache_key
             )
-            
-            # Get the content type from the response
-            content_type = response.headers.get("content-type", "")
-            
-            # Handle different response types
-            if "application/json" in content_type:
-                return JSONResponse(
-                    content=response.json(),
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
-            elif "text/html" in content_type:
-                return HTMLResponse(
-                    content=response.text,
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
+            if limit is not None:
+                response.headers.update(limit.headers())
+            return response
+
+    try:
+        guard = upstream_guards.get(service)
+        priority = priority_classifier.classify(service, request.method, f"/{path}", payload is not None)
+
+        # ETags, caching, coalescing and hedging need the whole body, everything else can stream.
+        # Buffered requests still stream responses that turn out too large to buffer.
+        flight_key = single_flight.key_for(service, path, request)
+        buffered = (
+            cache_key is not None
+            or flight_key is not None
+            or (request.method == "GET" and service in ETAG_SERVICES)
+            or (request.method in IDEMPOTENT_METHODS and service in HEDGE_SERVICES)
+        )
+
+        if PROXY_STREAMING and not buffered:
+            response = await _stream_request(service, guard, priority, path, request, headers, params)
+            apply_cache_policy(service, request.method, response.status_code, response.headers)
+        else:
+            body = await request.body()
+            if len(body) > PROXY_MAX_BODY_SIZE:
+                raise BodyTooLarge()
+            if request.method in CONDITIONAL_METHODS:
+                # If-None-Match is checked against the full response in _client_response
+                headers = {k: v for k, v in headers.items() if k not in CONDITIONAL_REQUEST_HEADERS}
+
+            def send_upstream():
+                return _buffered_request(service, guard, priority, path, request, headers, params, body)
+
+            if flight_key is not None:
+                status_code, response_headers, content = await single_flight.run(flight_key, send_upstream)
             else:
-                # For any other content type, return the raw response
-                return Response(
-                    content=response.content,
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
+                status_code, response_headers, content = await send_upstream()
+            if isinstance(content, UpstreamStream):
+                # Too large to buffer: relayed without an ETag and not cached
+                response = _relay(request, content)
+                apply_cache_policy(service, request.method, response.status_code, response.headers)
+            else:
+                if etag_enabled(service, request.method, status_code):
+                    response_headers.setdefault("etag", compute_etag(content))
+                if cache_key is not None:
+                    response_cache.store(cache_key, status_code, response_headers, content)
+                    response_headers["x-cache"] = "MISS"
+
+                response = await _client_response(service, request, status_code, response_headers, content, cache_key)
+
+        # Writes make every cached response of the service stale, in every worker
+        if request.method in INVALIDATING_METHODS:
+            shared_state.invalidate(service)
+
+        if limit is not None:
+            response.headers.update(limit.headers())
+        return response
+    except BodyTooLarge:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    except UpstreamUnavailable as e:
+        logger.warning(f"Rejected request to {service}: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except NoAvailableInstance as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail=f"Service {service} is unavailable: {str(e)}")
     except httpx.RequestError as e:
         logger.error(f"Service {service} is unavailable: {str(e)}")
         raise HTTPException(status_code=503, detail=f"Service {service} is unavailable: {str(e)}")
     except Exception as e:
         logger.error(f"Error proxying request to {service}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error proxying request to {service}: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error proxying request to {service}: {str(e)}")
+
+
+async def _client_response(
+    service: str,
+    request: Request,
+    status_code: int,
+    headers: Dict[str, str],
+    content: bytes,
+    cache_key: Optional[Tuple] = None,
+) -> Response:
+    """Build the response sent to the client from a fully read upstream response.
+
+    Compressible bodies are encoded with the best encoding the client accepts;
+    for cached responses the compressed copy is kept next to the entry so each
+    body is compressed once per encoding rather than once per request.
+    """
+    apply_cache_policy(service, request.method, status_code, headers)
+    encoding = None
+    if compressible(status_code, headers, len(content)):
+        add_vary(headers)
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+
+    # Each encoding is a separate representation with its own ETag
+    etag = headers.get("etag")
+    if encoding and etag:
+        etag = encoded_etag(etag, encoding)
+    if status_code == 200 and if_none_match(request, etag):
+        return not_modified({**headers, "etag": etag} if etag else headers)
+
+    if encoding:
+        encoded = response_cache.variant(cache_key, encoding) if cache_key is not None else None
+        if encoded is None:
+            encoded = await compress(content, encoding)
+            if cache_key is not None:
+                response_cache.add_variant(cache_key, encoding, encoded)
+        headers = encoded_headers(headers, encoding, len(encoded))
+        content = encoded
+
+    # Otherwise forward the upstream bytes unchanged, whatever the content type
+    return Response(
+        content=content,
+        status_code=status_code,
+        headers=headers
+    )
+
+
+def _call_failed(exc: BaseException) -> Optional[bool]:
+    """Classify an exception from an upstream call for the circuit breaker.
+
+    None means the call says nothing about upstream health (the client went
+    away or sent too much) and is not recorded.
+    """
+    if isinstance(exc, (asyncio.CancelledError, BodyTooLarge)):
+        return None
+    return True
+
+
+def _pick_instance(service: str, path: str, request: Request, tried: List[UpstreamInstance]) -> UpstreamInstance:
+    instance = UpstreamPool.choose(service, exclude=tried)
+    tried.append(instance)
+    # Log the request method and URL for debugging
+    logger.info(f"Proxying {request.method} request to {instance.url}/{path}")
+    return instance
+
+
+async def _buffered_request(
+    service: str,
+    guard: UpstreamGuard,
+    priority: PriorityClass,
+    path: str,
+    request: Request,
+    headers: Dict[str, str],
+    params: Dict[str, str],
+    body: bytes,
+) -> Tuple[int, Dict[str, str], Union[bytes, UpstreamStream]]:
+    """Send a fully read request upstream and return status, headers and raw body.
+
+    Idempotent requests are retried on connection errors and, for services in
+    HEDGE_SERVICES, hedged to another instance when the first attempt is slow.
+    Both draw from the route's retry budget. A response too large to buffer
+    is returned as an ``UpstreamStream`` as soon as its headers arrive, so a
+    hedge never downloads a large body twice.
+    """
+    idempotent = request.method in IDEMPOTENT_METHODS
+    budget = retry_budget(route_template(service, path))
+    budget.deposit()
+    tried: List[UpstreamInstance] = []
+    streams: List[UpstreamStream] = []
+
+    async def send_once() -> Tuple[int, Dict[str, str], Union[bytes, UpstreamStream]]:
+        started = await guard.acquire(priority)
+        instance = None
+        stream = None
+        try:
+            instance = _pick_instance(service, path, request, tried)
+            instance.outstanding += 1
+            timer = UpstreamTimer(service, instance.url)
+            with span("upstream", service=service, instance=instance.url) as upstream_span:
+                upstream_request = instance.client.build_request(
+                    method=request.method,
+                    url=f"/{path}",
+                    headers=inject(headers),
+                    params=params,
+                    content=body,
+                    extensions={"trace": timer.trace},
+                )
+                response = await instance.client.send(upstream_request, stream=True)
+                if upstream_span is not None:
+                    upstream_span.attributes["http.status_code"] = response.status_code
+                if _too_large_to_buffer(response):
+                    # The stream keeps the instance and bulkhead slot until it is closed
+                    stream = UpstreamStream(instance, response, guard, priority, started, timer)
+                    streams.append(stream)
+                else:
+                    try:
+                        content = await _read_raw(response)
+                    finally:
+                        await response.aclose()
+                        timer.finish()
+        except BaseException as e:
+            guard.release(priority, started, _call_failed(e))
+            raise
+        finally:
+            if instance is not None and stream is None:
+                instance.outstanding -= 1
+        latency_tracker(service).record(time.monotonic() - started)
+        if stream is not None:
+            return response.status_code, _response_headers(response), stream
+        guard.release(priority, started, response.status_code >= 500)
+        return response.status_code, _response_headers(response), content
+
+    async def attempt() -> Tuple[int, Dict[str, str], Union[bytes, UpstreamStream]]:
+        return await with_retries(send_once, idempotent, budget)
+
+    result = None
+    try:
+        result = await hedged(attempt, hedge_delay(service) if idempotent else None, budget)
+        return result
+    finally:
+        # Both hedged attempts can get their headers at once; only the winner is relayed
+        for stream in streams:
+            if result is None or stream is not result[2]:
+                await stream.aclose()
+
+
+async def _stream_request(
+    service: str,
+    guard: UpstreamGuard,
+    priority: PriorityClass,
+    path: str,
+    request: Request,
+    headers: Dict[str, str],
+    params: Dict[str, str],
+) -> StreamingResponse:
+    """Pipe the client body upstream and stream the upstream body back chunk by chunk.
+
+    Both directions are pulled one chunk at a time, so a slow reader on either
+    side applies backpressure instead of the gateway buffering the payload.
+    The bulkhead slot is held until the upstream body is closed. Requests
+    without a body are retried on connection errors.
+    """
+    has_body = "content-length" in headers or "transfer-encoding" in headers
+    budget = retry_budget(route_template(service, path))
+    budget.deposit()
+    tried: List[UpstreamInstance] = []
+
+    async def open_stream() -> UpstreamStream:
+        started = await guard.acquire(priority)
+        instance = None
+        try:
+            instance = _pick_instance(service, path, request, tried)
+            instance.outstanding += 1
+            timer = UpstreamTimer(service, instance.url)
+            # The span ends when the response headers arrive, the body is streamed after it
+            with span("upstream", service=service, instance=instance.url) as upstream_span:
+                upstream_request = instance.client.build_request(
+                    method=request.method,
+                    url=f"/{path}",
+                    headers=inject(headers),
+                    params=params,
+                    content=_limited_body(request) if has_body else None,
+                    extensions={"trace": timer.trace},
+                )
+                response = await instance.client.send(upstream_request, stream=True)
+                if upstream_span is not None:
+                    upstream_span.attributes["http.status_code"] = response.status_code
+            return UpstreamStream(instance, response, guard, priority, started, timer)
+        except BaseException as e:
+            if instance is not None:
+                instance.outstanding -= 1
+            guard.release(priority, started, _call_failed(e))
+            raise
+
+    retryable = request.method in IDEMPOTENT_METHODS and not has_body
+    return _relay(request, await with_retries(open_stream, retryable, budget))
+
+
+def _relay(request: Request, upstream: UpstreamStream) -> StreamingResponse:
+    """Stream an open upstream response to the client, compressing it on the fly when worthwhile"""
+
+    async def relay() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in upstream.response.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    body: AsyncIterator[bytes] = relay()
+    response_headers = _response_headers(upstream.response)
+    length = response_headers.get("content-length")
+    if compressible(upstream.response.status_code, response_headers, int(length) if length and length.isdigit() else None):
+        add_vary(response_headers)
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        if encoding:
+            # The compressed length isn't known up front, so the body goes out chunked
+            body = compress_stream(body, encoding)
+            response_headers = encoded_headers(response_headers, encoding, None)
+
+    # Forward the raw bytes so content-length and content-encoding stay valid
+    return StreamingResponse(
+        body,
+        status_code=upstream.response.status_code,
+        headers=response_headers,
+        background=BackgroundTask(upstream.aclose),
+    )
@@ -0,0 +1,198 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+from cache import response_cache
+from upstream import UpstreamInstance, UpstreamPool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Directory the gunicorn workers of one gateway share state through (gunicorn.conf.py sets it with
+# more than one worker); unset keeps everything in this process
+GATEWAY_STATE_DIR = os.getenv("GATEWAY_STATE_DIR")
+GATEWAY_STATE_SYNC_INTERVAL = float(os.getenv("GATEWAY_STATE_SYNC_INTERVAL", "0.5"))
+
+STATE_FILE = "state.json"
+LOCK_FILE = "state.lock"
+WORKER_FILE_PREFIX = "worker-"
+
+# Outstanding requests per service and instance URL
+InstanceCounts = Dict[str, Dict[str, int]]
+
+
+def _write_atomically(path: str, data: object) -> None:
+    """Replace ``path`` so readers see the old or the new content, never part of it"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+class SharedState:
+    """Drained instances and cache invalidations shared by all workers of a gateway.
+
+    Each worker keeps its upstream pools and response cache in its own
+    memory. Draining an instance or writing to a cached service is recorded
+    in ``state.json`` in GATEWAY_STATE_DIR (under an flock on ``state.lock``),
+    and every worker applies changes to that file within
+    GATEWAY_STATE_SYNC_INTERVAL. Workers also publish their outstanding
+    requests per instance to ``worker-<pid>.json`` so ``/upstreams`` can
+    report the total. Without GATEWAY_STATE_DIR changes only apply to this
+    process, which is then the whole gateway.
+    """
+
+    def __init__(self, directory: Optional[str] = GATEWAY_STATE_DIR, interval: float = GATEWAY_STATE_SYNC_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._seen: Optional[Tuple[int, int, int]] = None
+        self._invalidations: Dict[str, int] = {}
+        self._published: Optional[InstanceCounts] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def shared(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _worker_path(self, pid: int) -> str:
+        return self._path(f"{WORKER_FILE_PREFIX}{pid}.json")
+
+    def _read(self) -> Dict[str, object]:
+        try:
+            with open(self._path(STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _update(self, change: Callable[[Dict[str, object]], None]) -> Dict[str, object]:
+        """Read, change and write the state file while holding the lock; returns the new state"""
+        with open(self._path(LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._read()
+            change(state)
+            _write_atomically(self._path(STATE_FILE), state)
+        return state
+
+    def _apply(self, state: Dict[str, object]) -> None:
+        drained = {tuple(item) for item in state.get("draining", [])}
+        for service, instances in UpstreamPool.instances.items():
+            for instance in instances:
+                instance.draining = (service, instance.url) in drained
+        for service, count in state.get("invalidations", {}).items():
+            if count != self._invalidations.get(service, 0):
+                response_cache.invalidate(service)
+            self._invalidations[service] = count
+
+    def set_draining(self, instance: UpstreamInstance, draining: bool) -> None:
+        """Take an instance out of rotation (or put it back) in every worker"""
+        instance.draining = draining
+        if not self.shared:
+            return
+
+        def change(state: Dict[str, object]) -> None:
+            drained = {tuple(item) for item in state.get("draining", [])}
+            if draining:
+                drained.add((instance.service, instance.url))
+            else:
+                drained.discard((instance.service, instance.url))
+            state["draining"] = sorted(list(item) for item in drained)
+
+        self._apply(self._update(change))
+
+    def invalidate(self, service: str) -> None:
+        """Drop every cached response of a service, in every worker"""
+        response_cache.invalidate(service)
+        if not self.shared or service not in response_cache.services:
+            return
+
+        def change(state: Dict[str, object]) -> None:
+            counts = state.setdefault("invalidations", {})
+            counts[service] = counts.get(service, 0) + 1
+
+        # This worker has just invalidated, whatever other workers did before
+        self._invalidations[service] = self._update(change)["invalidations"][service]
+
+    def _local_counts(self) -> InstanceCounts:
+        return {
+            service: {instance.url: instance.outstanding for instance in instances}
+            for service, instances in UpstreamPool.instances.items()
+        }
+
+    def outstanding(self) -> InstanceCounts:
+        """Requests in flight per instance, summed over all workers"""
+        totals = self._local_counts()
+        if not self.shared:
+            return totals
+        own = self._worker_path(os.getpid())
+        for path in glob.glob(self._path(f"{WORKER_FILE_PREFIX}*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    counts: InstanceCounts = json.load(f)
+            except (OSError, ValueError):
+                # The worker exited in the meantime
+                continue
+            for service, urls in counts.items():
+                for url, count in urls.items():
+                    if url in totals.get(service, {}):
+                        totals[service][url] += count
+        return totals
+
+    def stats(self) -> Dict[str, List[Dict[str, object]]]:
+        """UpstreamPool.stats() with ``outstanding`` summed over all workers"""
+        totals = self.outstanding()
+        return {
+            service: [{**instance.stats(), "outstanding": totals[service][instance.url]} for instance in instances]
+            for service, instances in UpstreamPool.instances.items()
+        }
+
+    def sync(self) -> None:
+        """Apply changes other workers made and publish this worker's outstanding requests"""
+        try:
+            stat = os.stat(self._path(STATE_FILE))
+            seen = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            seen = None
+        if seen != self._seen:
+            self._seen = seen
+            self._apply(self._read())
+        counts = self._local_counts()
+        if counts != self._published:
+            _write_atomically(self._worker_path(os.getpid()), counts)
+            self._published = counts
+
+    async def start(self) -> None:
+        if not self.shared:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.sync()
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not sync shared gateway state: {str(e)}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.shared:
+            try:
+                os.remove(self._worker_path(os.getpid()))
+            except OSError:
+                pass
+
+
+# Create a singleton instance
+shared_state = SharedState()
@@ -0,0 +1,224 @@
+import asyncio
+import importlib.util
+import itertools
+import logging
+import os
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Upstream connection pool configuration
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "False").lower() == "true"
+UPSTREAM_WARMUP = os.getenv("UPSTREAM_WARMUP", "True").lower() == "true"
+UPSTREAM_WARMUP_PATH = os.getenv("UPSTREAM_WARMUP_PATH", "/health")
+
+# Load balancing and health check configuration
+LB_STRATEGY = os.getenv("LB_STRATEGY", "round_robin")  # round_robin or least_outstanding
+HEALTH_CHECK_ENABLED = os.getenv("HEALTH_CHECK_ENABLED", "True").lower() == "true"
+HEALTH_CHECK_PATH = os.getenv("HEALTH_CHECK_PATH", "/health")
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+HEALTH_CHECK_UNHEALTHY_THRESHOLD = int(os.getenv("HEALTH_CHECK_UNHEALTHY_THRESHOLD", "2"))
+HEALTH_CHECK_HEALTHY_THRESHOLD = int(os.getenv("HEALTH_CHECK_HEALTHY_THRESHOLD", "2"))
+
+
+class NoAvailableInstance(Exception):
+    """Raised when a service has no instance that can take requests"""
+
+
+class UpstreamInstance:
+    """One endpoint of an upstream service with its own pooled client"""
+
+    def __init__(self, service: str, url: str, client: httpx.AsyncClient):
+        self.service = service
+        self.url = url
+        self.client = client
+        self.healthy = True
+        self.draining = False
+        self.outstanding = 0
+        self._failures = 0
+        self._successes = 0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.draining
+
+    def record_probe(self, ok: bool) -> None:
+        """Update health from an active probe, using consecutive thresholds to avoid flapping"""
+        if ok:
+            self._failures = 0
+            self._successes += 1
+            if not self.healthy and self._successes >= HEALTH_CHECK_HEALTHY_THRESHOLD:
+                self.healthy = True
+                logger.warning(f"Instance {self.url} of {self.service} is healthy again")
+        else:
+            self._successes = 0
+            self._failures += 1
+            if self.healthy and self._failures >= HEALTH_CHECK_UNHEALTHY_THRESHOLD:
+                self.healthy = False
+                logger.warning(f"Instance {self.url} of {self.service} removed from rotation")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "outstanding": self.outstanding,
+        }
+
+
+class UpstreamPool:
+    """Long-lived httpx clients for every instance of every upstream service.
+
+    Clients are created when the application starts (once per worker) and
+    reused for every proxied request so keep-alive connections are shared
+    instead of paying TCP connect and DNS lookup on each call. Requests are
+    balanced across the healthy, non-draining instances of a service.
+    """
+    instances: Dict[str, List[UpstreamInstance]] = {}
+    services: Dict[str, List[str]] = {}
+    _counters: Dict[str, "itertools.count"] = {}
+    _health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def _http2_enabled(cls) -> bool:
+        if not UPSTREAM_HTTP2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("UPSTREAM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+            return False
+        return True
+
+    @classmethod
+    def _create_client(cls, base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            http2=cls._http2_enabled(),
+            follow_redirects=False,
+        )
+
+    @classmethod
+    def _ensure_instances(cls, service: str) -> List[UpstreamInstance]:
+        instances = cls.instances.get(service)
+        if instances is None:
+            instances = cls.instances[service] = [
+                UpstreamInstance(service, url, cls._create_client(url)) for url in cls.services.get(service, [])
+            ]
+            cls._counters[service] = itertools.count()
+        return instances
+
+    @classmethod
+    async def start(cls, services: Dict[str, List[str]]) -> None:
+        """Create a client per instance, warm up connections and start health checks"""
+        cls.services = {name: list(urls) for name, urls in services.items()}
+        for name in cls.services:
+            cls._ensure_instances(name)
+        logger.info(
+            f"Upstream pool started for {', '.join(cls.services)} "
+            f"(max_connections={UPSTREAM_MAX_CONNECTIONS}, "
+            f"max_keepalive={UPSTREAM_MAX_KEEPALIVE}, http2={cls._http2_enabled()}, "
+            f"strategy={LB_STRATEGY})"
+        )
+        if UPSTREAM_WARMUP:
+            await cls.warmup()
+        if HEALTH_CHECK_ENABLED:
+            cls._health_task = asyncio.create_task(cls._health_loop())
+
+    @classmethod
+    def _all_instances(cls) -> List[UpstreamInstance]:
+        return [instance for instances in cls.instances.values() for instance in instances]
+
+    @classmethod
+    async def warmup(cls) -> None:
+        """Open one connection to every instance so the first request doesn't pay for it"""
+        async def _ping(instance: UpstreamInstance) -> None:
+            try:
+                await instance.client.get(UPSTREAM_WARMUP_PATH, timeout=UPSTREAM_CONNECT_TIMEOUT)
+                logger.info(f"Warmed up connection to {instance.url}")
+            except httpx.HTTPError as e:
+                logger.warning(f"Warm-up of {instance.url} failed: {str(e)}")
+
+        await asyncio.gather(*(_ping(instance) for instance in cls._all_instances()))
+
+    @classmethod
+    async def check_health(cls) -> None:
+        """Probe every instance once"""
+        async def _probe(instance: UpstreamInstance) -> None:
+            try:
+                response = await instance.client.get(HEALTH_CHECK_PATH, timeout=HEALTH_CHECK_TIMEOUT)
+                ok = response.status_code == 200
+                if ok and "application/json" in response.headers.get("content-type", ""):
+                    body = response.json()
+                    ok = not (isinstance(body, dict) and body.get("status") == "unhealthy")
+            except (httpx.HTTPError, ValueError):
+                ok = False
+            instance.record_probe(ok)
+
+        await asyncio.gather(*(_probe(instance) for instance in cls._all_instances()))
+
+    @classmethod
+    async def _health_loop(cls) -> None:
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            try:
+                await cls.check_health()
+            except Exception as e:
+                logger.error(f"Health check round failed: {str(e)}")
+
+    @classmethod
+    def choose(cls, service: str, exclude: Sequence[UpstreamInstance] = ()) -> UpstreamInstance:
+        """Pick an instance of a service with the configured balancing strategy.
+
+        Instances in ``exclude`` (already tried by a retry or hedge) are avoided
+        while any other instance is available.
+        """
+        instances = cls._ensure_instances(service)
+        candidates = [i for i in instances if i.available and i not in exclude]
+        if not candidates:
+            candidates = [i for i in instances if i.available]
+        if not candidates:
+            # Fail open rather than turning a health-check problem into an outage
+            candidates = [i for i in instances if not i.draining]
+            if candidates:
+                logger.warning(f"No healthy instance of {service}, trying unhealthy ones")
+        if not candidates:
+            raise NoAvailableInstance(f"No available instance of {service}")
+
+        if LB_STRATEGY == "least_outstanding":
+            return min(candidates, key=lambda i: i.outstanding)
+        return candidates[next(cls._counters[service]) % len(candidates)]
+
+    @classmethod
+    def find(cls, service: str, url: str) -> Optional[UpstreamInstance]:
+        for instance in cls.instances.get(service, []):
+            if instance.url == url.rstrip("/"):
+                return instance
+        return None
+
+    @classmethod
+    def stats(cls) -> Dict[str, List[Dict[str, object]]]:
+        return {service: [i.stats() for i in instances] for service, instances in cls.instances.items()}
+
+    @classmethod
+    async def close(cls) -> None:
+        """Stop health checks and close all pooled clients"""
+        if cls._health_task is not None:
+            cls._health_task.cancel()
+            cls._health_task = None
+        instances, cls.instances = cls._all_instances(), {}
+        await asyncio.gather(*(i.client.aclose() for i in instances), return_exceptions=True)
+        logger.info("Upstream pool closed")
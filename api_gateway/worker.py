@@ -0,0 +1,12 @@
+from uvicorn.workers import UvicornWorker
+
+
+class GatewayWorker(UvicornWorker):
+    """Gunicorn worker running the app on uvicorn with uvloop and httptools.
+
+    Unlike ``uvicorn.workers.UvicornWorker`` ("auto"), a missing uvloop or
+    httptools fails the worker at boot instead of silently falling back to
+    the slower asyncio loop and h11 parser.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
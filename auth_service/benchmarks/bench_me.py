@@ -0,0 +1,193 @@
+"""Concurrent load benchmark for ``GET /me``.
+
+Starts the auth service (``main:app``) in a subprocess against the MongoDB
+at MONGODB_URL, seeds a verified user, and drives ``/me`` with that user's
+token at a fixed concurrency. Reports throughput, latency percentiles and
+errors; results can be saved as JSON and compared with an earlier run, e.g.
+one taken on another commit:
+
+    python benchmarks/bench_me.py --concurrency 50 --duration 15 --output before.json
+    python benchmarks/bench_me.py --concurrency 50 --duration 15 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+from pymongo import MongoClient
+
+AUTH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AUTH_DIR)
+from security import create_access_token  # noqa: E402
+
+BENCH_EMAIL = "bench-me@example.com"
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def seed_user(mongodb_url: str) -> str:
+    """Create (or reuse) a verified benchmark user and return an access token for it"""
+    client = MongoClient(mongodb_url, serverSelectionTimeoutMS=5000)
+    try:
+        users = client.get_database().users_collection
+        users.update_one(
+            {"email": BENCH_EMAIL},
+            {"$setOnInsert": {
+                "username": "bench-me",
+                "email": BENCH_EMAIL,
+                "password_hash": "-",
+                "first_name": "Bench",
+                "last_name": "User",
+                "gender": "other",
+                "date_of_birth": datetime(1990, 1, 1),
+                "created_at": datetime.utcnow(),
+                "is_active": True,
+                "is_verified": True,
+                "provider": "local",
+            }},
+            upsert=True,
+        )
+        user = users.find_one({"email": BENCH_EMAIL})
+    finally:
+        client.close()
+    return create_access_token({"sub": BENCH_EMAIL, "user_id": str(user["_id"])})
+
+
+def start_service(args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(os.environ, TRACE_SAMPLE_RATE="0")
+    if args.server == "gunicorn":
+        env.update({"HOST": "127.0.0.1", "PORT": str(args.port), "LOG_LEVEL": "warning"})
+        if args.workers:
+            env["WEB_CONCURRENCY"] = str(args.workers)
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning", "--no-access-log",
+        ]
+    process = subprocess.Popen(command, cwd=AUTH_DIR, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Auth service exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/health", timeout=1).json().get("status") == "healthy":
+                return process
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Auth service did not become healthy")
+
+
+async def drive(url: str, token: str, concurrency: int, duration: float, latencies: Optional[List[float]]) -> int:
+    """Run ``concurrency`` clients for ``duration`` seconds; returns the number of errors"""
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30, headers={"Authorization": f"Bearer {token}"}) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker() -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if latencies is not None:
+                    latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return errors
+
+
+def compare(result: dict, baseline_path: str, threshold: float) -> bool:
+    """Print the change against an earlier run; True if rps dropped or p99 rose beyond ``threshold``"""
+    with open(baseline_path) as f:
+        before = json.load(f)["result"]
+    rps_change = (result["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+    p99_change = (result["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+    regressed = rps_change < -threshold or p99_change > threshold
+    print(
+        f"rps {before['rps']} -> {result['rps']} ({rps_change:+.0%}), "
+        f"p99 {before['p99_ms']} ms -> {result['p99_ms']} ms ({p99_change:+.0%}){'  REGRESSION' if regressed else ''}"
+    )
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark GET /me of the auth service")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds of load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of warm-up")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients")
+    parser.add_argument("--port", type=int, default=9400, help="Port of the auth service")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn",
+                        help="Single uvicorn process, or the production gunicorn setup (gunicorn.conf.py)")
+    parser.add_argument("--workers", type=int, help="gunicorn workers (default: one per CPU)")
+    parser.add_argument("--output", help="Write the result to this JSON file")
+    parser.add_argument("--compare", help="Compare with an earlier JSON result and exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative drop in rps or rise in p99")
+    args = parser.parse_args()
+
+    token = seed_user(os.getenv("MONGODB_URL", "mongodb://localhost:27017/bookshop"))
+    service = start_service(args)
+    url = f"http://127.0.0.1:{args.port}/me"
+    latencies: List[float] = []
+    try:
+        asyncio.run(drive(url, token, min(args.concurrency, 10), args.warmup, None))
+        started = time.perf_counter()
+        errors = asyncio.run(drive(url, token, args.concurrency, args.duration, latencies))
+        elapsed = time.perf_counter() - started
+    finally:
+        service.terminate()
+        service.wait(timeout=30)
+
+    ordered = sorted(latencies)
+    result = {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+    print(
+        f"GET /me  {result['rps']} rps  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  "
+        f"p99 {result['p99_ms']} ms  errors {errors}"
+    )
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+                "args": vars(args),
+            },
+            "result": result,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Result written to {args.output}")
+    if args.compare and compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,82 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+import pymongo
+from pymongo import ASCENDING, IndexModel, MongoClient, monitoring
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, OperationFailure, ServerSelectionTimeoutError
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+from tracing import end_span, start_span
 
 logger = logging.getLogger(__name__)
 
+# Connection pool and operation timeout configuration
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_OPERATION_TIMEOUT = float(os.getenv("MONGO_OPERATION_TIMEOUT", "5"))
+
+T = TypeVar("T")
+
+# Indexes of users_collection, created at startup. Every query is by _id, email or username, and
+# the unique constraints are what rejects duplicate registrations.
+USER_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+]
+
+class MongoTracer(monitoring.CommandListener):
+    """Record a span for every MongoDB command sent while handling a traced request"""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        current = start_span(f"mongo.{event.command_name}", **{"db.name": event.database_name})
+        if current is not None:
+            self._spans[event.request_id] = current
+
+    def succeeded(self, event):
+        end_span(self._spans.pop(event.request_id, None))
+
+    def failed(self, event):
+        current = self._spans.pop(event.request_id, None)
+        if current is not None:
+            current.attributes["error"] = event.failure.get("errmsg", "failed") if isinstance(event.failure, dict) else "failed"
+        end_span(current)
+
+class AsyncCollection:
+    """Awaitable counterpart of a pymongo collection, running each call on the database threads"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Optional[Dict[str, Any]]:
+        return await Database.run(self.collection.find_one, *args, timeout=timeout, **kwargs)
+
+    async def insert_one(self, *args: Any, timeout: Optional[float] = None, **kwargs: Any):
+        return await Database.run(self.collection.insert_one, *args, timeout=timeout, **kwargs)
+
+    async def update_one(self, *args: Any, timeout: Optional[float] = None, **kwargs: Any):
+        return await Database.run(self.collection.update_one, *args, timeout=timeout, **kwargs)
+
+
 class Database:
     client = None
     db = None
     users_collection = None
+    users: Optional[AsyncCollection] = None
+    _executor: Optional[ThreadPoolExecutor] = None
+    _slots: Optional[asyncio.Semaphore] = None
 
     @classmethod
     @retry(
         stop=stop_after_attempt(5),
         wait=wait_exponential(multiplier=1, min=4, max=10),
+        # A failed index build (e.g. duplicate data) won't fix itself by retrying
+        retry=retry_if_not_exception_type(OperationFailure),
         reraise=True
     )
     def connect_db(cls):
@@ -28,12 +90,24 @@ class Database:
             
             logger.info(f"Connecting to MongoDB at {mongodb_url}")
             
-            cls.client = MongoClient(mongodb_url, serverSelectionTimeoutMS=5000)
+            cls.client = MongoClient(
+                mongodb_url,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                event_listeners=[MongoTracer()],
+            )
             # Test the connection
             cls.client.admin.command('ping')
             
             cls.db = cls.client.get_database()
             cls.users_collection = cls.db.users_collection
+            cls.users = AsyncCollection(cls.users_collection)
+            cls.ensure_indexes()
+
+            # One thread per pooled connection; callers beyond that wait on the semaphore, not in the executor
+            cls._executor = ThreadPoolExecutor(max_workers=MONGO_MAX_POOL_SIZE, thread_name_prefix="mongo")
+            cls._slots = asyncio.Semaphore(MONGO_MAX_POOL_SIZE)
             
             logger.info("Successfully connected to MongoDB")
             return True
@@ -44,24 +118,69 @@ class Database:
             logger.error(f"Unexpected error connecting to MongoDB: {e}")
             raise
 
+    @classmethod
+    def ensure_indexes(cls):
+        """Create the declared indexes; a no-op for those that already exist.
+
+        Registration relies on the unique indexes to reject duplicates, so the
+        service doesn't start without them (e.g. while existing users share an
+        email or username).
+        """
+        try:
+            created = cls.users_collection.create_indexes(USER_INDEXES)
+        except OperationFailure as e:
+            logger.error(f"Failed to create MongoDB indexes, remove duplicate users and restart: {e}")
+            raise
+        logger.info(f"MongoDB indexes ready: {', '.join(created)}")
+
+    @classmethod
+    async def run(cls, operation: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> T:
+        """Run a blocking pymongo call on a database thread instead of the event loop.
+
+        At most MONGO_MAX_POOL_SIZE calls run at once. ``timeout`` (default
+        MONGO_OPERATION_TIMEOUT seconds) covers waiting for a thread and the
+        operation itself, which pymongo enforces with a server-side timeout.
+        The call runs in a copy of the caller's context, so the command
+        listener records its spans in the current trace.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or MONGO_OPERATION_TIMEOUT
+        deadline = loop.time() + timeout
+        try:
+            await asyncio.wait_for(cls._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise ExecutionTimeout(f"No database thread became free within {timeout}s")
+
+        call = functools.partial(cls._call, operation, args, kwargs, deadline - loop.time())
+        future = cls._executor.submit(contextvars.copy_context().run, call)
+        # Free the slot when the thread is done, even if the caller gave up on the result
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(cls._slots.release))
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _call(operation: Callable[..., T], args, kwargs, remaining: float) -> T:
+        with pymongo.timeout(max(remaining, 0.001)):
+            return operation(*args, **kwargs)
+
     @classmethod
     def close_db(cls):
         """Close MongoDB connection"""
+        if cls._executor:
+            cls._executor.shutdown(wait=True)
         if cls.client:
             cls.client.close()
             logger.info("MongoDB connection closed")
 
     @classmethod
-    def health_check(cls) -> bool:
+    async def health_check(cls) -> bool:
         try:
             if not cls.client:
                 return False
-            cls.client.admin.command('ping')
+            await cls.run(cls.client.admin.command, 'ping')
             return True
         except Exception as e:
             logger.error(f"Health check failed: {e}")
             return False
 
-# Initialize database connection
-db = Database()
-db.connect_db()
\ No newline at end of file
+# Connected in the app's startup event, so every server worker opens its own pool after fork
+db = Database()
\ No newline at end of file
@@ -8,6 +8,7 @@ import traceback
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import aiosmtplib
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +84,8 @@ async def send_verification_email(email: EmailStr, token: str) -> bool:
         )
         
         fm = FastMail(conf)
-        await fm.send_message(message)
+        with span("email.send"):
+            await fm.send_message(message)
         return True
     except Exception as e:
         logger.error(f"Error sending verification email: {str(e)}")
@@ -100,7 +102,8 @@ async def send_password_reset_email(email: EmailStr, token: str) -> bool:
         )
         
         fm = FastMail(conf)
-        await fm.send_message(message)
+        with span("email.send"):
+            await fm.send_message(message)
         return True
     except Exception as e:
         logger.error(f"Error sending password reset email: {str(e)}")
@@ -135,7 +138,8 @@ class EmailService:
             )
             
             fm = FastMail(conf)
-            await fm.send_message(message)
+            with span("email.send"):
+                await fm.send_message(message)
             logger.info(f"Email sent successfully to {recipient}")
         except Exception as e:
             error_details = traceback.format_exc()
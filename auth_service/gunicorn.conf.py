@@ -0,0 +1,64 @@
+"""Production server settings: ``gunicorn -c gunicorn.conf.py main:app``
+
+Gunicorn supervises one uvicorn worker (uvloop and httptools) per CPU. The
+app is imported once in the master and forked, and each worker connects to
+MongoDB in the startup event (MongoClient is not fork-safe). On SIGTERM
+workers stop accepting, finish in-flight requests (up to GRACEFUL_TIMEOUT)
+and close their connections.
+"""
+import glob
+import math
+import os
+
+
+def cpu_count() -> int:
+    """CPUs available to this process, honouring a cgroup v2 CPU quota (containers)"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(cpu_count())))
+worker_class = "worker.AuthWorker"
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))
+backlog = int(os.getenv("LISTEN_BACKLOG", "2048"))
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# prometheus_client reads this when it is first imported, which happens when
+# the app is preloaded, so it has to be set here. Each worker writes its
+# samples to files in the directory and /metrics aggregates them.
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/auth-prometheus")
+
+# Split the CPUs between the workers' bcrypt threads, so a host runs about one
+# hashing thread per CPU in total rather than one per CPU in every worker
+os.environ.setdefault("HASH_WORKERS", str(max(1, cpu_count() // workers)))
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Samples of a previous run would be added to this one's
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
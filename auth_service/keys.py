@@ -0,0 +1,250 @@
+"""JWT signing keys.
+
+Tokens are signed with the shared secret (HS256, the default) or, with
+JWT_ALGORITHM=RS256 or EdDSA, with a private key from JWT_KEYS_DIR. Each key
+is a PEM file named after its key ID: ``<kid>.pem`` holds a private key that
+can sign, ``<kid>.pub.pem`` a public key kept only to verify tokens signed
+before a rotation. Every key's public half is published as a JWKS. Each
+worker rereads the directory when it changes (checked every
+JWT_KEYS_RELOAD_INTERVAL seconds), so keys are rotated without a restart.
+
+Generate a key with:
+
+    python keys.py generate 2026-10 --algorithm EdDSA --dir keys
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.exceptions import JWKError
+from jose.utils import base64url_decode, base64url_encode
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# JWT Configuration
+JWT_SECRET_KEY = os.getenv("jwtSecretKey")
+if not JWT_SECRET_KEY:
+    logger.warning("JWT_SECRET_KEY environment variable not set, using default")
+    JWT_SECRET_KEY = "your-secret-key-here"
+
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
+if not JWT_ALGORITHM:
+    logger.warning("JWT_ALGORITHM environment variable not set, using default")
+    JWT_ALGORITHM = "HS256"
+
+# Asymmetric signing configuration
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "keys")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")  # unset: the private key with the highest key ID signs
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+JWT_KEYS_RELOAD_INTERVAL = float(os.getenv("JWT_KEYS_RELOAD_INTERVAL", "10"))  # 0 disables reloading
+
+PUBLIC_SUFFIX = ".pub.pem"
+PRIVATE_SUFFIX = ".pem"
+
+
+class Ed25519Key(Key):
+    """EdDSA (Ed25519) key for python-jose, which only ships HMAC, RSA and EC keys"""
+
+    def __init__(self, key: Any, algorithm: str):
+        if isinstance(key, dict):
+            if key.get("kty") != "OKP" or key.get("crv") != "Ed25519":
+                raise JWKError("Not an Ed25519 JWK")
+            key = ed25519.Ed25519PublicKey.from_public_bytes(base64url_decode(key["x"].encode()))
+        elif isinstance(key, (str, bytes)):
+            data = key.encode() if isinstance(key, str) else key
+            try:
+                key = serialization.load_pem_private_key(data, password=None)
+            except (ValueError, TypeError):
+                try:
+                    key = serialization.load_pem_public_key(data)
+                except ValueError:
+                    raise JWKError("Not a PEM encoded key")
+        if not isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+            raise JWKError("Not an Ed25519 key")
+        self._key = key
+
+    def sign(self, msg: bytes) -> bytes:
+        if not isinstance(self._key, ed25519.Ed25519PrivateKey):
+            raise JWKError("An Ed25519 public key can't sign")
+        return self._key.sign(msg)
+
+    def verify(self, msg: bytes, sig: bytes) -> bool:
+        try:
+            self._public().verify(sig, msg)
+            return True
+        except InvalidSignature:
+            return False
+
+    def public_key(self) -> "Ed25519Key":
+        return Ed25519Key(self._public(), "EdDSA")
+
+    def to_dict(self) -> Dict[str, str]:
+        raw = self._public().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {"alg": "EdDSA", "kty": "OKP", "crv": "Ed25519", "x": base64url_encode(raw).decode()}
+
+    def _public(self) -> ed25519.Ed25519PublicKey:
+        if isinstance(self._key, ed25519.Ed25519PrivateKey):
+            return self._key.public_key()
+        return self._key
+
+
+jwk.register_key("EdDSA", Ed25519Key)
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    public: Key
+    private: Optional[Key]  # None for keys kept only to verify
+
+    def public_jwk(self) -> Dict[str, str]:
+        return {**self.public.to_dict(), "kid": self.kid, "use": "sig"}
+
+
+class KeyRing:
+    """Sign tokens with the active key and verify them with the key named by their ``kid`` header.
+
+    With an HMAC algorithm the shared secret does both and nothing is published.
+    """
+
+    def __init__(self, algorithm: str = JWT_ALGORITHM, secret: str = JWT_SECRET_KEY, directory: str = JWT_KEYS_DIR, active_kid: Optional[str] = JWT_ACTIVE_KID):
+        self.algorithm = algorithm
+        self.secret = secret
+        self.directory = directory
+        self.active_kid = active_kid
+        self.keys: Dict[str, SigningKey] = {}
+        self.active: Optional[SigningKey] = None
+        self.jwks: Dict[str, Any] = {"keys": []}
+        self.etag = ""
+        # Incremented on every (re)load, so caches of verified tokens know to start over
+        self.version = 0
+        self._loaded = False
+        self._snapshot: Tuple[Tuple[str, int, int], ...] = ()
+        self._checked = 0.0
+
+    @property
+    def symmetric(self) -> bool:
+        return self.algorithm.startswith("HS")
+
+    def _directory_snapshot(self) -> Tuple[Tuple[str, int, int], ...]:
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*" + PRIVATE_SUFFIX)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def refresh(self) -> None:
+        """Load the keys on first use, and reload them when the key directory has changed"""
+        if not self._loaded:
+            self.load()
+            return
+        if self.symmetric or JWT_KEYS_RELOAD_INTERVAL <= 0 or time.monotonic() - self._checked < JWT_KEYS_RELOAD_INTERVAL:
+            return
+        self._checked = time.monotonic()
+        if self._directory_snapshot() != self._snapshot:
+            try:
+                self.load()
+            except RuntimeError as e:
+                # E.g. a key file written halfway; keep the keys that work
+                logger.error(f"Keeping the current JWT keys: {e}")
+
+    def load(self) -> None:
+        """(Re)read the key directory; raises if no usable private key is found"""
+        keys: Dict[str, SigningKey] = {}
+        self._checked = time.monotonic()
+        if not self.symmetric:
+            self._snapshot = self._directory_snapshot()
+            for path in sorted(glob.glob(os.path.join(self.directory, "*" + PRIVATE_SUFFIX))):
+                name = os.path.basename(path)
+                private = not name.endswith(PUBLIC_SUFFIX)
+                kid = name[:-len(PRIVATE_SUFFIX if private else PUBLIC_SUFFIX)]
+                if kid in keys and keys[kid].private is not None:
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        key = jwk.construct(f.read(), self.algorithm)
+                except (OSError, JWKError) as e:
+                    logger.error(f"Ignoring JWT key {path}, not a {self.algorithm} key: {e}")
+                    continue
+                keys[kid] = SigningKey(kid, key.public_key(), key if private else None)
+
+            signers = sorted(kid for kid, key in keys.items() if key.private is not None)
+            active_kid = self.active_kid or (signers[-1] if signers else None)
+            if active_kid not in signers:
+                raise RuntimeError(f"No {self.algorithm} private key {active_kid or '*.pem'} in {self.directory}")
+            self.active = keys[active_kid]
+            logger.info(f"JWT keys loaded, signing with {active_kid}, publishing {', '.join(sorted(keys))}")
+
+        self.keys = keys
+        self.jwks = {"keys": [key.public_jwk() for key in keys.values()]}
+        body = json.dumps(self.jwks, sort_keys=True).encode()
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.version += 1
+        self._loaded = True
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        if self.symmetric:
+            return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+        self.refresh()
+        return jwt.encode(claims, self.active.private, algorithm=self.algorithm, headers={"kid": self.active.kid})
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Return the verified claims or raise JWTError"""
+        if self.symmetric:
+            return jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        self.refresh()
+        # Only the configured algorithm is accepted, whatever the header says
+        key = self.keys.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key.public, algorithms=[self.algorithm])
+
+
+# Create a singleton instance
+key_ring = KeyRing()
+
+
+def generate(kid: str, algorithm: str, directory: str) -> str:
+    """Write a new private key to ``<directory>/<kid>.pem`` and return the path"""
+    if algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm.startswith("RS"):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise SystemExit(f"Can't generate keys for {algorithm}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, kid + PRIVATE_SUFFIX)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+        f.write(pem)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("generate", help="Generate a private key")
+    create.add_argument("kid", help="Key ID; the key with the highest ID signs unless JWT_ACTIVE_KID is set")
+    create.add_argument("--algorithm", choices=("RS256", "EdDSA"), default="EdDSA")
+    create.add_argument("--dir", default=JWT_KEYS_DIR, help="Key directory")
+    args = parser.parse_args()
+    print(generate(args.kid, args.algorithm, args.dir))
+
+
+if __name__ == "__main__":
+    main()
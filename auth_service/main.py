@@ -1,10 +1,15 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from routes import router
+from middleware import RequestLoggingMiddleware
+from tracing import TracingMiddleware, close_exporter
 import logging
-import time
 from database import db
+from metrics import render as render_metrics
+from security import hash_pool
+from keys import key_ring
 import uvicorn
 
 # Configure logging
@@ -32,17 +37,10 @@ app.add_middleware(
 )
 
 # Request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    duration = time.time() - start_time
-    logger.info(
-        f"{request.method} {request.url.path} "
-        f"completed in {duration:.2f}s "
-        f"with status {response.status_code}"
-    )
-    return response
+app.add_middleware(RequestLoggingMiddleware)
+
+# Trace context propagation and Server-Timing
+app.add_middleware(TracingMiddleware, name="auth")
 
 # Error handling
 @app.exception_handler(Exception)
@@ -56,13 +54,15 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    try:
-        # Check database connection
-        db.client.admin.command('ping')
+    # Check database connection
+    if await db.health_check():
         return {"status": "healthy", "service": "auth-service"}
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return {"status": "unhealthy", "service": "auth-service"}
+    return {"status": "unhealthy", "service": "auth-service"}
+
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 # Include routers
 app.include_router(router)
@@ -71,11 +71,15 @@ app.include_router(router)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting up Authentication Service")
+    key_ring.load()
+    db.connect_db()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Authentication Service")
     db.close_db()
+    hash_pool.close()
+    close_exporter()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
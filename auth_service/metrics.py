@@ -0,0 +1,49 @@
+import os
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# bcrypt at the default cost takes a few hundred milliseconds per call; waits can reach seconds under a burst
+HASH_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PASSWORD_HASH_QUEUE_SECONDS = Histogram(
+    "auth_password_hash_queue_seconds",
+    "Time a password hash or verification waited for a hashing thread",
+    ["operation"],
+    buckets=HASH_BUCKETS,
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "auth_password_hash_seconds",
+    "Time spent hashing or verifying a password on a hashing thread",
+    ["operation"],
+    buckets=HASH_BUCKETS,
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "auth_password_hash_rejected_total",
+    "Password operations refused with 503 because the hashing queue was full",
+    ["operation"],
+)
+PASSWORD_HASH_QUEUED = Gauge(
+    "auth_password_hash_queued",
+    "Password operations waiting for a hashing thread",
+    multiprocess_mode="livesum",
+)
+
+TOKEN_CACHE_LOOKUPS = Counter(
+    "auth_token_cache_lookups_total",
+    "Access token verifications, answered from the verified-token cache (hit) or by decoding (miss)",
+    ["result"],
+)
+TOKEN_CACHE_ENTRIES = Gauge(
+    "auth_token_cache_entries",
+    "Verified access tokens in the cache",
+    multiprocess_mode="livesum",
+)
+
+
+def render() -> bytes:
+    """Metrics in the Prometheus text format, aggregated over all gunicorn workers when
+    PROMETHEUS_MULTIPROC_DIR is set"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
@@ -0,0 +1,42 @@
+import logging
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLoggingMiddleware:
+    """Pure ASGI middleware that logs method, path, status and duration of each request.
+
+    Only the status is captured from the ``http.response.start`` message;
+    the response itself is passed straight through, so there is no extra
+    task or memory stream per request as with ``@app.middleware("http")``.
+    The duration covers the whole response, body included.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start_time
+            logger.info(
+                f"{scope['method']} {scope['path']} "
+                f"completed in {duration:.2f}s "
+                f"with status {status_code}"
+            )
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Form
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from jose import JWTError
 from database import db
+from keys import JWKS_MAX_AGE, key_ring
 from security import (
     hash_password,
     verify_password,
@@ -9,7 +11,9 @@ from security import (
     create_email_token,
     verify_email_token,
     create_password_reset_token,
-    verify_password_reset_token
+    verify_password_reset_token,
+    authenticate_introspect_client,
+    token_cache
 )
 from models import (
     UserCreate,
@@ -23,6 +27,7 @@ from email_service import email_service
 import logging
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import asyncio
 
 # Configure logging
@@ -44,7 +49,9 @@ async def get_routes():
             {"method": "POST", "path": "/forgot-password", "description": "Request password reset"},
             {"method": "POST", "path": "/reset-password", "description": "Reset password"},
             {"method": "GET", "path": "/me", "description": "Get current user info"},
-            {"method": "PUT", "path": "/me", "description": "Update current user info"}
+            {"method": "PUT", "path": "/me", "description": "Update current user info"},
+            {"method": "POST", "path": "/introspect", "description": "Check an access token and return its claims"},
+            {"method": "GET", "path": "/.well-known/jwks.json", "description": "Public keys that sign access tokens"}
         ]
     }
 
@@ -52,16 +59,6 @@ async def get_routes():
 async def register(user: UserCreate):
     """Register a new user and send verification email"""
     try:
-        # Check if user exists
-        if db.users_collection.find_one({"$or": [
-            {"username": user.username},
-            {"email": user.email}
-        ]}):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username or email already exists"
-            )
-
         # Parse date_of_birth
         try:
             date_of_birth = datetime.strptime(user.date_of_birth, '%Y-%m-%d')
@@ -76,7 +73,7 @@ async def register(user: UserCreate):
         user_data = {
             "username": user.username,
             "email": user.email,
-            "password_hash": hash_password(user.password),
+            "password_hash": await hash_password(user.password),
             "first_name": user.first_name,
             "last_name": user.last_name,
             "gender": user.gender,
@@ -87,8 +84,14 @@ async def register(user: UserCreate):
             "provider": "local"
         }
         
-        # Insert user into database
-        result = db.users_collection.insert_one(user_data)
+        # Insert user into database; the unique indexes on username and email reject existing users
+        try:
+            result = await db.users.insert_one(user_data)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already exists"
+            )
         user_id = str(result.inserted_id)
         user_data["id"] = user_id
         
@@ -129,11 +132,11 @@ async def login(user: UserLogin):
     try:
         # Check if the login identifier is an email or username
         if "@" in user.email:  # Assume it's an email if it contains @
-            user_data = db.users_collection.find_one({"email": user.email})
+            user_data = await db.users.find_one({"email": user.email})
         else:  # Otherwise assume it's a username
-            user_data = db.users_collection.find_one({"username": user.email})
+            user_data = await db.users.find_one({"username": user.email})
             
-        if not user_data or not verify_password(user.password, user_data["password_hash"]):
+        if not user_data or not await verify_password(user.password, user_data["password_hash"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
@@ -146,7 +149,7 @@ async def login(user: UserLogin):
             )
         
         # Create access token
-        access_token = create_access_token({"sub": user_data["email"]})
+        access_token = create_access_token({"sub": user_data["email"], "user_id": str(user_data["_id"])})
         logger.info(f"User logged in successfully: {user_data['email']}")
         return Token(
             access_token=access_token,
@@ -240,7 +243,7 @@ async def verify_email(user_id: str, token: str):
             )
         
         # Update user verification status
-        result = db.users_collection.update_one(
+        result = await db.users.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": {"is_verified": True}}
         )
@@ -358,7 +361,7 @@ async def forgot_password(reset_request: PasswordReset):
     """Request password reset"""
     try:
         # Find user by email
-        user = db.users_collection.find_one({"email": reset_request.email})
+        user = await db.users.find_one({"email": reset_request.email})
         if not user:
             # Don't reveal if email exists
             return {"message": "If the email exists, a password reset link has been sent"}
@@ -391,9 +394,9 @@ async def reset_password(reset_data: PasswordResetConfirm):
             )
         
         # Update password
-        result = db.users_collection.update_one(
+        result = await db.users.update_one(
             {"email": email},
-            {"$set": {"password_hash": hash_password(reset_data.new_password)}}
+            {"$set": {"password_hash": await hash_password(reset_data.new_password)}}
         )
         
         # Check if user was found and updated
@@ -404,6 +407,8 @@ async def reset_password(reset_data: PasswordResetConfirm):
             )
         
         return {"message": "Password reset successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Password reset error: {e}")
         raise HTTPException(
@@ -428,7 +433,7 @@ async def get_current_user(request: Request):
         token_data = verify_token(token)
         
         # Find user by email
-        user = db.users_collection.find_one({"email": token_data["sub"]})
+        user = await db.users.find_one({"email": token_data["sub"]})
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -469,7 +474,7 @@ async def update_current_user(request: Request, user_update: dict):
         token_data = verify_token(token)
         
         # Find user by email
-        user = db.users_collection.find_one({"email": token_data["sub"]})
+        user = await db.users.find_one({"email": token_data["sub"]})
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -491,7 +496,7 @@ async def update_current_user(request: Request, user_update: dict):
                 )
         
         # Update user in database
-        result = db.users_collection.update_one(
+        result = await db.users.update_one(
             {"_id": user["_id"]},
             {"$set": update_data}
         )
@@ -503,7 +508,7 @@ async def update_current_user(request: Request, user_update: dict):
             )
         
         # Get updated user
-        updated_user = db.users_collection.find_one({"_id": user["_id"]})
+        updated_user = await db.users.find_one({"_id": user["_id"]})
         updated_user["id"] = str(updated_user["_id"])
         
         # Convert date_of_birth from datetime to string
@@ -519,3 +524,32 @@ async def update_current_user(request: Request, user_update: dict):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error updating user profile"
         )
+
+@router.post("/introspect")
+async def introspect(request: Request, token: str = Form(...)):
+    """Check an access token's signature and expiry and return its claims (RFC 7662 style).
+
+    Callers authenticate with HTTP Basic credentials from INTROSPECT_CLIENTS.
+    Only the token itself is checked, without a database lookup, so a
+    deactivated user's token stays active until it expires.
+    """
+    if authenticate_introspect_client(request.headers.get("authorization")) is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid client credentials",
+            headers={"WWW-Authenticate": 'Basic realm="introspect"'}
+        )
+    try:
+        payload = token_cache.verify(token)
+    except JWTError:
+        return {"active": False}
+    return {"active": True, "token_type": "access_token", **payload}
+
+@router.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    """Public keys for verifying access tokens locally; empty while tokens are HMAC signed"""
+    key_ring.refresh()
+    headers = {"Cache-Control": f"public, max-age={JWKS_MAX_AGE}", "ETag": key_ring.etag}
+    if request.headers.get("if-none-match") == key_ring.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=key_ring.jwks, headers=headers)
@@ -1,11 +1,31 @@
-from jose import jwt, JWTError
+from jose import JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import binascii
+import contextvars
+import functools
+import hashlib
+import hmac
 import os
 import logging
+import time
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
+from tracing import span
+from keys import key_ring
+from metrics import (
+    PASSWORD_HASH_QUEUE_SECONDS,
+    PASSWORD_HASH_QUEUED,
+    PASSWORD_HASH_REJECTED,
+    PASSWORD_HASH_SECONDS,
+    TOKEN_CACHE_ENTRIES,
+    TOKEN_CACHE_LOOKUPS,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -13,67 +33,203 @@ logger = logging.getLogger(__name__)
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# JWT Configuration
-JWT_SECRET_KEY = os.getenv("jwtSecretKey")
-if not JWT_SECRET_KEY:
-    logger.warning("JWT_SECRET_KEY environment variable not set, using default")
-    JWT_SECRET_KEY = "your-secret-key-here"
+# Hashing threads per worker and operations allowed to wait for one. Under gunicorn the
+# default is the CPUs divided by the workers (gunicorn.conf.py); a single process uses all CPUs.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "0")) or len(os.sched_getaffinity(0))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "32"))
 
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
-if not JWT_ALGORITHM:
-    logger.warning("JWT_ALGORITHM environment variable not set, using default")
-    JWT_ALGORITHM = "HS256"
+T = TypeVar("T")
 
+# Token lifetimes; signing keys and algorithm are configured in keys.py
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Verified access tokens kept per worker
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
 EMAIL_TOKEN_EXPIRE_HOURS = 24
 PASSWORD_RESET_TOKEN_EXPIRE_HOURS = 1
 
+# "purpose" claim of single-use tokens, which must not be accepted as access tokens
+EMAIL_TOKEN_PURPOSE = "email_verification"
+PASSWORD_RESET_TOKEN_PURPOSE = "password_reset"
+
+# client_id:secret pairs allowed to call /introspect with HTTP Basic authentication; empty disables it
+INTROSPECT_CLIENTS = dict(
+    item.strip().split(":", 1) for item in os.getenv("INTROSPECT_CLIENTS", "").split(",") if ":" in item
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class HashPool:
+    """Runs bcrypt on a few dedicated threads instead of the event loop.
+
+    bcrypt releases the GIL while it hashes, so the threads use several cores
+    and the event loop keeps serving other requests. At most ``max_queue``
+    operations wait for a thread; beyond that callers get a 503.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_queue: int = HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.waiting = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self, operation: str, function: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._slots = asyncio.Semaphore(self.workers)
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            PASSWORD_HASH_REJECTED.labels(operation).inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Too many password operations in progress, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+        queued = time.perf_counter()
+        self.waiting += 1
+        PASSWORD_HASH_QUEUED.inc()
+        try:
+            with span("bcrypt.queue"):
+                await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+            PASSWORD_HASH_QUEUED.dec()
+        PASSWORD_HASH_QUEUE_SECONDS.labels(operation).observe(time.perf_counter() - queued)
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._timed, operation, function, args)
+        future = self._executor.submit(contextvars.copy_context().run, call)
+        # Free the slot when the thread is done, even if the caller gave up on the result
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._slots.release))
+        return await asyncio.wrap_future(future)
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    @staticmethod
+    def _timed(operation: str, function: Callable[..., T], args) -> T:
+        started = time.perf_counter()
+        try:
+            with span(f"bcrypt.{operation}"):
+                return function(*args)
+        finally:
+            PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+# Create a singleton instance
+hash_pool = HashPool()
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await hash_pool.run("verify", pwd_context.verify, plain_password, hashed_password)
+
+async def hash_password(password: str) -> str:
+    return await hash_pool.run("hash", pwd_context.hash, password)
 
 def create_access_token(data: Dict[str, Any]) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+    return key_ring.encode(to_encode)
 
 def create_email_token(data: Dict[str, Any]) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=EMAIL_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+    to_encode.update({"exp": expire, "purpose": EMAIL_TOKEN_PURPOSE})
+    return key_ring.encode(to_encode)
 
 def create_password_reset_token(data: Dict[str, Any]) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=PASSWORD_RESET_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+    to_encode.update({"exp": expire, "purpose": PASSWORD_RESET_TOKEN_PURPOSE})
+    return key_ring.encode(to_encode)
+
+class TokenCache:
+    """Verified access token payloads in a bounded LRU keyed by a digest of the token.
+
+    An entry is only served until the token's own ``exp``, so a cached token
+    expires exactly when it would have failed verification. Tokens without
+    ``exp`` are not cached, and email verification and password reset tokens
+    are rejected. The cache is emptied whenever the signing keys are reloaded,
+    so tokens of a removed key stop being accepted.
+    """
+
+    def __init__(self, size: int = JWT_CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._key_version = key_ring.version
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the payload of a valid access token or raise JWTError"""
+        key_ring.refresh()
+        if key_ring.version != self._key_version:
+            TOKEN_CACHE_ENTRIES.dec(len(self._entries))
+            self._entries.clear()
+            self._key_version = key_ring.version
+
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self._entries.get(digest)
+        if cached is not None:
+            payload, expires_at = cached
+            if expires_at > time.time():
+                self._entries.move_to_end(digest)
+                TOKEN_CACHE_LOOKUPS.labels("hit").inc()
+                return payload
+            del self._entries[digest]
+            TOKEN_CACHE_ENTRIES.dec()
+
+        TOKEN_CACHE_LOOKUPS.labels("miss").inc()
+        payload = key_ring.decode(token)
+        if "purpose" in payload:
+            raise JWTError("Not an access token")
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            self._entries[digest] = (payload, float(exp))
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            else:
+                TOKEN_CACHE_ENTRIES.inc()
+        return payload
+
+# Create a singleton instance
+token_cache = TokenCache()
 
 def verify_token(token: str) -> Dict[str, Any]:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
+        return token_cache.verify(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def _verify_purpose_token(token: str, purpose: str) -> Dict[str, Any]:
+    payload = key_ring.decode(token)
+    # Access tokens have no purpose claim and must not pass as single-use tokens
+    if payload.get("purpose") != purpose:
+        raise JWTError(f"Not a {purpose} token")
+    return payload
+
 def verify_email_token(token: str) -> Dict[str, Any]:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
+        return _verify_purpose_token(token, EMAIL_TOKEN_PURPOSE)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid email verification token")
 
 def verify_password_reset_token(token: str) -> Dict[str, Any]:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
+        return _verify_purpose_token(token, PASSWORD_RESET_TOKEN_PURPOSE)
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid password reset token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid password reset token")
+
+def authenticate_introspect_client(authorization: Optional[str]) -> Optional[str]:
+    """Client ID of valid HTTP Basic credentials from INTROSPECT_CLIENTS, or None"""
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    try:
+        client_id, _, secret = base64.b64decode(credentials.strip(), validate=True).decode().partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    expected = INTROSPECT_CLIENTS.get(client_id)
+    if expected is None or not hmac.compare_digest(secret.encode(), expected.encode()):
+        return None
+    return client_id
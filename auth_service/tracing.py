@@ -0,0 +1,234 @@
+"""Request tracing for the auth service.
+
+The same span model as the gateway's tracing module, kept to what this
+service needs: it is only called through the gateway, so an incoming
+``traceparent`` (including its sampling decision) is continued as is, and
+it makes no traced calls of its own, so it sends none.
+"""
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Tracing configuration
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "auth-service")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")  # JSON lines, one span per line; unset disables export
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "True").lower() == "true"
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "_started", "duration")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, object]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, object]:
+        """OTLP-style JSON representation"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.start_ns + int(self.elapsed() * 1e9),
+            "attributes": {"service.name": TRACE_SERVICE_NAME, **self.attributes},
+        }
+
+
+class Trace:
+    """Spans recorded for one request.
+
+    Unsampled requests still time their spans when Server-Timing is enabled,
+    but only sampled ones are exported.
+    """
+
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+    def finish(self, span: Span) -> None:
+        span.end()
+        self.spans.append(span)
+        if self.sampled:
+            _exporter.export(span)
+
+
+class SpanExporter:
+    """Append finished spans to TRACE_EXPORT_FILE as JSON lines"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._file = None
+
+    def export(self, span: Span) -> None:
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                # Line buffered so workers appending to the same file don't interleave partial lines
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(json.dumps(span.to_dict()) + "\n")
+        except OSError as e:
+            logger.error(f"Could not export span to {self.path}: {str(e)}")
+            self.path = None
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_exporter = SpanExporter(TRACE_EXPORT_FILE)
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header, None if invalid"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        if int(trace_id, 16) == 0 or int(parent_id, 16) == 0:
+            return None
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return trace_id.lower(), parent_id.lower(), sampled
+
+
+def start_span(name: str, **attributes: object) -> Optional[Span]:
+    """Start a span that is ended explicitly with ``end_span``, for callback-based instrumentation"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    return Span(trace.trace_id, parent.span_id if parent else None, name, attributes)
+
+
+def end_span(current: Optional[Span]) -> None:
+    trace = _current_trace.get()
+    if current is not None and trace is not None and trace.trace_id == current.trace_id:
+        trace.finish(current)
+
+
+@contextmanager
+def span(name: str, **attributes: object) -> Iterator[Optional[Span]]:
+    """Record a child span of the current span; a no-op outside a traced request"""
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(current)
+
+
+def server_timing(trace: Trace, root: Span) -> str:
+    """Server-Timing value with the root span and the summed duration of each child span name"""
+    totals: Dict[str, float] = {}
+    for child in trace.spans:
+        totals[child.name] = totals.get(child.name, 0.0) + (child.duration or 0.0)
+    entries = [f"{root.name};dur={root.elapsed() * 1000:.1f}"]
+    entries.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+    if trace.sampled:
+        entries.append(f'trace;desc="{trace.trace_id}"')
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware that starts a trace for every request.
+
+    An incoming ``traceparent`` is continued (including its sampling
+    decision); otherwise a new trace is sampled at TRACE_SAMPLE_RATE. The
+    root span covers the request until the response headers are sent, when
+    a ``Server-Timing`` header is added.
+    """
+
+    def __init__(self, app: ASGIApp, name: str):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = f"{random.getrandbits(128):032x}", None, random.random() < TRACE_SAMPLE_RATE
+        if not sampled and not SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(trace_id, sampled)
+        root = Span(trace_id, parent_id, self.name, {"http.method": scope["method"], "http.target": scope["path"]})
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.end()
+                root.attributes["http.status_code"] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    timing = server_timing(trace, root)
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if sampled:
+                root.end()
+                _exporter.export(root)
+
+
+def close_exporter() -> None:
+    _exporter.close()
@@ -0,0 +1,11 @@
+from uvicorn.workers import UvicornWorker
+
+
+class AuthWorker(UvicornWorker):
+    """Gunicorn worker running the app on uvicorn with uvloop and httptools.
+
+    A missing uvloop or httptools fails the worker at boot instead of
+    silently falling back to the asyncio loop and h11 parser.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}